@@ -2,10 +2,9 @@
 
 
 import os
-import sys
-from bible import Bible
 from bible_statistics import BibleGroup
-from generate import RandomBible
+from manifest import Manifest
+from pipeline import process_languages
 
 
 source_dirs = ["../bibles/Usable/",
@@ -23,81 +22,75 @@ selected_dir = 2
 generate_random = False
 generate_geomlen = False
 make_plots = True
+plot_density = False  # binned scatter plots, for very large vocabularies
 process_stats = False
 single_bible = False
 MAX = 4
+workers = 1         # > 1 fans the languages out to a process pool
+random_seed = None  # set to make random bible generation reproducible
+corpus_file = None  # shared corpus built by corpus.py, e.g. "../cache/corpus.bin"
+manifest_file = "../cache/manifest.json"  # None makes all plots and results again
 bibles = BibleGroup()
 
-i=0
+file_paths = []
 for _, _, filenames in os.walk(source_dirs[selected_dir]):
     for filename in filenames:
-        new_bible = Bible.from_path(source_dirs[selected_dir] + filename)
-        if len(new_bible) > 27:
-            new_bible = new_bible.get_new_testament()
-        bibles.add(new_bible)
-        print("({0}) Counted toks: {1}, Reported: {2}".format(
-                                                new_bible.language,
-                                                new_bible.token_count(),
-                                                new_bible.reported_word_count
-                                                )
-              )
-        if make_plots:
-            plot_folder = "../plots/" + parent_dirs[selected_dir]
-            new_bible.plot_freq_long(plot_folder=plot_folder)
-            print("\t\t finished plot_freq_long")
-            new_bible.plot_freq_varlong_novar(plot_folder=plot_folder)
-            print("\t\t finished plot_freq_varlong_novar")
-            new_bible.plot_freq_varlong_var0(plot_folder=plot_folder)
-            print("\t\t finished plot_freq_varlong_var0")
-            new_bible.plot_long_freq(plot_folder=plot_folder)
-            print("\t\t finished plot_long_freq")
-            new_bible.plot_long_varfreq_novar(plot_folder=plot_folder)
-            print("\t\t finished plot_long_varfreq_novar")
-            new_bible.plot_long_varfreq_var0(plot_folder=plot_folder)
-            print("\t\t finished plot_long_varfreq_var0")
-            new_bible.plot_freq_meanlong_var0(plot_folder=plot_folder)
-            print("\t\t finished plot_freq_meanlong_var0")
-            new_bible.plot_freq_meanlong_novar(plot_folder=plot_folder)
-            print("\t\t finished plot_freq_meanlong_novar")
-            
+        file_paths.append(source_dirs[selected_dir] + filename)
+if single_bible:
+    file_paths = file_paths[:MAX + 1]
+
+if __name__ == "__main__":
+    summaries = process_languages(
+                    file_paths,
+                    workers=workers,
+                    plot_folder="../plots/" + parent_dirs[selected_dir] \
+                                                    if make_plots else None,
+                    random_folder=source_dirs[1] if generate_random else None,
+                    geomlen_folder=source_dirs[2] if generate_geomlen else None,
+                    seed=random_seed,
+                    corpus=corpus_file,
+                    plot_density=plot_density,
+                    manifest=manifest_file)
+    for summary in summaries:
+        bibles.add(summary)
         
-        if generate_random:
-            random_bible = RandomBible.create_xml_from(new_bible,
-                                                       source_dirs[1])
-            
-        if generate_geomlen:
-            random_whitespace_bibles = RandomBible.create_xml_from(new_bible,
-                                                                   source_dirs[2],
-                                                                   "geomlen")
-            
-        if single_bible and i == MAX:
-            break
-        i += 1
+    if process_stats:
+        # the tables are only made again when a bible or their code changed
+        results = Manifest(manifest_file)
+        table_key = Manifest.key("tables", BibleGroup.table_version,
+                                 bibles.stats_digest())
+        data_file = "../results/" + parent_dirs[selected_dir] + \
+                                                "bible_word_frequency_data.csv"
+        summary_file = "../results/" + parent_dirs[selected_dir] + \
+                                        "summary_bible_word_frequency_data.csv"
+        spearman_file = "../results/" + parent_dirs[selected_dir] + \
+                                                            "spearman_cors.csv"
         
-if process_stats:
-    dataframe = bibles.to_dataframe()
-    dataframe = dataframe.dropna(axis=1,how='all')
-    
-    dataframe.to_csv("../results/" + parent_dirs[selected_dir] + \
-                                                "bible_word_frequency_data.csv")
-    summary = dataframe.describe()
-    summary.to_csv("../results/" + parent_dirs[selected_dir] + \
-                                        "summary_bible_word_frequency_data.csv")
-    
-    corrs = dataframe.corr("spearman")
-    corrs = corrs.dropna(axis=0, how="all")
-    corrs = corrs.dropna(axis=1, how="all")
-    #corrs.to_csv("../results/correlation_matrix.csv")
+        if not (results.is_current(data_file, table_key) and \
+                results.is_current(summary_file, table_key)):
+            dataframe = bibles.to_dataframe()
+            dataframe = dataframe.dropna(axis=1,how='all')
+        
+            dataframe.to_csv(data_file)
+            results.record(data_file, table_key)
+            summary = dataframe.describe()
+            summary.to_csv(summary_file)
+            results.record(summary_file, table_key)
+        
+            corrs = dataframe.corr("spearman")
+            corrs = corrs.dropna(axis=0, how="all")
+            corrs = corrs.dropna(axis=1, how="all")
+            #corrs.to_csv("../results/correlation_matrix.csv")
     
-    spearman = bibles.spearman_dataframe()
-    spearman.to_csv("../results/" + parent_dirs[selected_dir] + \
-                                                            "spearman_cors.csv")
+        results.update(spearman_file, table_key,
+                       lambda: bibles.spearman_dataframe().to_csv(spearman_file))
+        results.save()
     
-    #spearman_var = bibles.spearman_var_dataframe()
-    #spearman_var.to_csv("../results/spearman_var_cors.csv")
+        #spearman_var = bibles.spearman_var_dataframe()
+        #spearman_var.to_csv("../results/spearman_var_cors.csv")
     
-    #spearman_novar = bibles.spearman_novar_dataframe()
-    #spearman_novar.to_csv("../results/spearman_novar_cors.csv")
+        #spearman_novar = bibles.spearman_novar_dataframe()
+        #spearman_novar.to_csv("../results/spearman_novar_cors.csv")
     
-    #bibles.plot_cumulative_dist()
-    #import ipdb;ipdb.set_trace()
+        #bibles.plot_cumulative_dist()
+        #import ipdb;ipdb.set_trace()
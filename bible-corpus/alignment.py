@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+
+from collections import OrderedDict
+
+import numpy as np
+
+from bible import Bible
+
+
+class AlignmentIndex(object):
+    # Position of every verse id in every language. The rows are all the
+    # verse ids found in any language in canonical order (Bible.all_books,
+    # then chapter and verse numbers) and positions[row, language] is the
+    # index of the verse in the ColumnStore of that language, -1 when the
+    # language does not have it, so the verse or a range of verses is
+    # looked up across all the languages at once.
+    #
+    # Verses with an empty text are the ones translated together with a
+    # neighbour ("two verses translated as one"); they are kept in the
+    # positions and listed in merged, with the verse holding their text.
+    # Ids repeated in a file point to their first occurrence and are listed
+    # in duplicates.
+
+    missing = -1
+
+    _book_order = dict((book_id, order) for order, book_id in \
+                                                enumerate(Bible.all_books))
+
+    def __init__(self, languages, stores, verse_ids, positions, merged,
+                 duplicates):
+        self.languages = languages
+        self.stores = stores
+        self.verse_ids = verse_ids
+        self.positions = positions
+        self.merged = merged
+        self.duplicates = duplicates
+        self.rows = dict((verse_id, row) for row, verse_id in \
+                                                    enumerate(verse_ids))
+
+    @classmethod
+    def verse_key(cls, verse_id):
+        # Sort key of "b.BOOK.chapter.verse" ids; ids that do not follow
+        # the pattern go last
+        parts = verse_id.split(".")
+        try:
+            return AlignmentIndex._book_order[".".join(parts[:2])], \
+                   int(parts[2]), int(parts[3]), verse_id
+        except (KeyError, IndexError, ValueError):
+            return len(Bible.all_books), 0, 0, verse_id
+
+    @classmethod
+    def scan(cls, store):
+        # One pass over the verses of a language: the position of each id,
+        # the merged verses and the repeated ids
+        positions = {}
+        merged = OrderedDict()
+        duplicates = []
+        holder = None
+        holder_chapter = None
+        verse_chapter = store.verse_chapter
+        text_offsets = store.texts.offsets
+        for position, verse_id in enumerate(store.verse_ids):
+            if verse_id in positions:
+                duplicates.append(verse_id)
+                continue
+            positions[verse_id] = position
+            chapter = verse_chapter[position]
+            if text_offsets[position + 1] != text_offsets[position]:
+                holder = verse_id
+                holder_chapter = chapter
+            else:
+                merged[verse_id] = holder if holder_chapter == chapter \
+                                                                else None
+        return positions, merged, duplicates
+
+    @classmethod
+    def build(cls, stores):
+        # stores: language name -> ColumnStore, in the order of the columns
+        stores = OrderedDict(stores)
+        scans = [AlignmentIndex.scan(store) for store in stores.values()]
+        verse_ids = sorted(set().union(*[positions for positions, _, _ in \
+                                                                    scans]),
+                           key=AlignmentIndex.verse_key)
+        rows = dict((verse_id, row) for row, verse_id in enumerate(verse_ids))
+
+        positions = np.full((len(verse_ids), len(stores)),
+                            AlignmentIndex.missing,
+                            dtype=np.int32)
+        merged = OrderedDict()
+        duplicates = OrderedDict()
+        for column, (language, (verse_positions, language_merged,
+                                language_duplicates)) in \
+                                    enumerate(zip(stores, scans)):
+            positions[[rows[verse_id] for verse_id in verse_positions],
+                      column] = list(verse_positions.values())
+            merged[language] = language_merged
+            duplicates[language] = language_duplicates
+        return AlignmentIndex(list(stores), stores, verse_ids, positions,
+                              merged, duplicates)
+
+    @classmethod
+    def from_bibles(cls, bibles):
+        # bibles: language name -> Bible, or a sequence of Bibles named by
+        # their language
+        if not isinstance(bibles, dict):
+            bibles = OrderedDict((bible.language, bible) for bible in bibles)
+        return AlignmentIndex.build((language, bible.column_store()) for \
+                                            language, bible in bibles.items())
+
+    @classmethod
+    def from_paths(cls, file_paths, corpus=None):
+        # Named by file path; from the shared corpus file when given
+        return AlignmentIndex.from_bibles(OrderedDict(
+                            (file_path, Bible.from_source(file_path, corpus)) \
+                                                for file_path in file_paths))
+
+    def __len__(self):
+        return len(self.verse_ids)
+
+    def __contains__(self, verse_id):
+        return verse_id in self.rows
+
+    def row(self, verse_id):
+        try:
+            return self.rows[verse_id]
+        except KeyError:
+            raise KeyError("Verse not in any language: {0}".format(verse_id))
+
+    def row_range(self, first_id, last_id):
+        # Rows of the verses from first_id to last_id, both included
+        return self.row(first_id), self.row(last_id) + 1
+
+    def aligned_positions(self, verse_id):
+        return self.positions[self.row(verse_id)]
+
+    def _texts(self, row_positions):
+        texts = OrderedDict()
+        for language, position in zip(self.languages,
+                                      row_positions.tolist()):
+            if position == AlignmentIndex.missing:
+                texts[language] = None
+            else:
+                texts[language] = self.stores[language].texts[position]
+        return texts
+
+    def verse(self, verse_id):
+        # language -> text of the verse, None where it is missing and ""
+        # where it is merged with a neighbour
+        return self._texts(self.aligned_positions(verse_id))
+
+    def verse_range(self, first_id, last_id):
+        # (verse id, language -> text) for the verses of a range
+        first, end = self.row_range(first_id, last_id)
+        for row in range(first, end):
+            yield self.verse_ids[row], self._texts(self.positions[row])
+
+    def missing_verses(self, language):
+        column = self.languages.index(language)
+        rows = np.flatnonzero(self.positions[:, column] == \
+                                                    AlignmentIndex.missing)
+        return [self.verse_ids[row] for row in rows.tolist()]
+
+    def coverage(self):
+        # language -> fraction of the verse ids it has
+        present = (self.positions != AlignmentIndex.missing).sum(axis=0)
+        return OrderedDict((language, int(count) / len(self)) for \
+                            language, count in zip(self.languages,
+                                                   present.tolist()))
@@ -0,0 +1,348 @@
+# -*- coding:utf-8 -*-
+
+# Timings of the hot paths of the corpus tools. Run from this folder:
+#     python benchmark.py tokenizer [file.xml ...]
+#     python benchmark.py hierarchy [file.xml ...]
+#     python benchmark.py spearman [file.xml ...]
+#     python benchmark.py imports [module ...]
+#     python benchmark.py corpus [corpus file] [file.xml ...]
+#     python benchmark.py plots [file.xml ...]
+
+import gc
+import glob
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+from bible import Bible
+from bible_statistics import BibleGroup
+from columnar import ColumnStore
+from corpus import CorpusStore
+from correlation import spearman_batch
+from plotting import plot_file, plot_names
+from reader import BibleReader
+from tokenizer import get_tokenizer
+
+
+default_files = ["../bibles/Usable/Estonian.xml",
+                 "../bibles/Usable/Chinantec-NT.xml"]
+
+
+def legacy_tokenize(text):
+    # Verse.tokenize as it was before the tokenizer module
+    temp_text = re.sub(r'[^\w\s]',
+                       '',
+                       text,
+                       re.UNICODE).replace("\t",
+                                           "").replace("\n",
+                                                       "").lower()
+    temp = temp_text.split(" ")
+    while '' in temp:
+        temp.remove('')
+    return temp
+
+
+def best_of(function, repeat=5):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def report(name, seconds, quantity, unit, baseline=None):
+    line = "\t{0:<24}{1:>10.4f} s {2:>14,.0f} {3}/s".format(name,
+                                                           seconds,
+                                                           quantity / seconds,
+                                                           unit)
+    if baseline is not None:
+        line += "  x{0:.2f}".format(baseline / seconds)
+    print(line)
+
+
+def benchmark_tokenizer(*file_paths):
+    tokenizer = get_tokenizer()
+    for file_path in file_paths or default_files:
+        texts = [text for _, _, _, text in BibleReader(file_path).verses()]
+        # a long verse shows how the legacy empty-token removal scales
+        long_text = "  ".join(texts[:1000])
+        print("{0} ({1} verses)".format(file_path, len(texts)))
+
+        legacy = best_of(lambda: [legacy_tokenize(text) for text in texts])
+        report("legacy", legacy, len(texts), "verses")
+        report("tokenize",
+               best_of(lambda: [tokenizer.tokenize(text) for text in texts]),
+               len(texts), "verses", legacy)
+        report("tokenize_batch",
+               best_of(lambda: tokenizer.tokenize_batch(texts)),
+               len(texts), "verses", legacy)
+
+        legacy = best_of(lambda: legacy_tokenize(long_text), 1)
+        report("legacy (long verse)", legacy, len(long_text), "chars")
+        report("tokenize (long verse)",
+               best_of(lambda: tokenizer.tokenize(long_text), 1),
+               len(long_text), "chars", legacy)
+
+
+class LegacyVerse(object):
+    # The object graph of verses, chapters and books as it was before the
+    # column store: one object with a __dict__ and a parent reference each
+
+    def __init__(self, verse_id, text, parent_chapter, verse_type="verse"):
+        self._id = verse_id
+        self._type = verse_type
+        self._parent = parent_chapter
+        self.text = text
+
+
+class LegacyChapter(object):
+
+    def __init__(self, chapter_id, parent_book, chapter_type="chapter"):
+        self._id = chapter_id
+        self._type = chapter_type
+        self._parent = parent_book
+        self.verses = []
+
+
+class LegacyBook(object):
+
+    def __init__(self, book_id, book_type="book"):
+        self._id = book_id
+        self._type = book_type
+        self.chapters = []
+
+    @classmethod
+    def from_record(cls, record):
+        book_id, chapter_records = record
+        book = LegacyBook(book_id)
+        for chapter_id, verse_records in chapter_records:
+            chapter = LegacyChapter(chapter_id, book)
+            for verse_id, text in verse_records:
+                chapter.verses.append(LegacyVerse(verse_id, text, chapter))
+            book.chapters.append(chapter)
+        return book
+
+
+def traced_size(function):
+    # Bytes still allocated by what function returns, and the result
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, result
+
+
+def traverse(books):
+    # Walks the whole hierarchy through the Book.chapters / Chapter.verses
+    # API, reading every id and text
+    size = 0
+    for book in books:
+        for chapter in book.chapters:
+            for verse in chapter.verses:
+                size += len(verse._id) + len(verse.text)
+    return size
+
+
+def benchmark_hierarchy(*file_paths):
+    for file_path in file_paths or default_files:
+        book_records = list(BibleReader(file_path).book_records())
+        # the texts are shared by both representations; copy them so each
+        # one is measured with its own strings
+        copy = lambda: [(book_id,
+                         [(chapter_id,
+                           [(verse_id.encode("utf-8").decode("utf-8"),
+                             text.encode("utf-8").decode("utf-8")) \
+                                        for verse_id, text in verse_records]) \
+                                for chapter_id, verse_records in chapters]) \
+                            for book_id, chapters in book_records]
+        verses = sum(len(verse_records) for _, chapters in book_records \
+                                        for _, verse_records in chapters)
+        print("{0} ({1} verses)".format(file_path, verses))
+
+        legacy_size, legacy_books = traced_size(lambda: [
+                                        LegacyBook.from_record(record) \
+                                            for record in copy()])
+        store_size, store = traced_size(lambda: ColumnStore.from_records(
+                                                                    copy()))
+        books = list(Bible.book_set(store).books_with_id())
+        print("\t{0:<24}{1:>10,} bytes".format("legacy objects",
+                                                legacy_size))
+        print("\t{0:<24}{1:>10,} bytes  x{2:.2f}".format(
+                                                "column store",
+                                                store_size,
+                                                legacy_size / store_size))
+
+        legacy = best_of(lambda: gc.collect())
+        report("gc.collect (legacy)", legacy, verses, "verses")
+        del legacy_books[:]
+        report("gc.collect (columns)", best_of(lambda: gc.collect()),
+               verses, "verses", legacy)
+
+        legacy_books = [LegacyBook.from_record(record) for record in \
+                                                            book_records]
+        legacy = best_of(lambda: traverse(legacy_books))
+        report("traverse (legacy)", legacy, verses, "verses")
+        report("traverse (views)", best_of(lambda: traverse(books)),
+               verses, "verses", legacy)
+        report("texts (columns)",
+               best_of(lambda: sum(len(text) for text in store.texts)),
+               verses, "verses", legacy)
+
+
+def benchmark_spearman(*file_paths):
+    group = BibleGroup()
+    for file_path in file_paths or sorted(glob.glob("../bibles/Usable/*.xml")):
+        bible = Bible.from_path(file_path)
+        if len(bible) > 27:
+            bible = bible.get_new_testament()
+        group.add(bible.summary())
+    series = [BibleGroup.spearman_series(bible) for bible in group.bibles]
+    relationships = list(series[0])
+    print("{0} bibles, {1} relationships".format(len(group.bibles),
+                                                  len(relationships)))
+
+    # one scipy.stats.spearmanr call per relationship and language, as
+    # spearman_dataframe did before the batch engine
+    legacy = best_of(lambda: [group.spearmanr(xy[name][0], xy[name][1]) \
+                                    for xy in series for name in relationships],
+                     3)
+    report("scipy per series", legacy, len(series) * len(relationships),
+           "series")
+    report("spearman_batch",
+           best_of(lambda: [spearman_batch([xy[name][0] for xy in series],
+                                           [xy[name][1] for xy in series]) \
+                                                for name in relationships], 3),
+           len(series) * len(relationships), "series", legacy)
+    report("spearman_novar_dataframe",
+           best_of(lambda: group.spearman_novar_dataframe(), 3),
+           len(series), "bibles")
+
+
+# modules of the fast-start API and the packages their import must not load
+core_modules = ["reader", "tokenizer", "vocabulary", "counting", "columnar",
+                "cache", "corpus", "bible", "alignment"]
+heavy_packages = ["matplotlib", "pandas", "scipy", "Bio", "rpy2"]
+
+import_script = """
+import sys, time
+start = time.perf_counter()
+import {0}
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(" ".join(name for name in {1!r} if name in sys.modules))
+"""
+
+
+def import_time(module):
+    # (seconds, heavy packages loaded) of importing a module in a new
+    # interpreter, as a script would
+    output = subprocess.check_output([sys.executable, "-c",
+                                      import_script.format(module,
+                                                           heavy_packages)],
+                                     universal_newlines=True).split("\n")
+    return float(output[0]), output[1].split()
+
+
+def benchmark_imports(*modules):
+    # Fails when a core module pulls in the plotting or statistics stacks
+    failures = []
+    for module in modules or core_modules:
+        timings = [import_time(module) for _ in range(3)]
+        seconds = min(elapsed for elapsed, _ in timings)
+        loaded = timings[0][1]
+        print("\t{0:<24}{1:>10.4f} s  {2}".format(module, seconds,
+                                                  " ".join(loaded)))
+        if loaded:
+            failures.append(module)
+    if failures:
+        print("heavy packages imported by: {0}".format(", ".join(failures)))
+        sys.exit(1)
+
+
+corpus_script = """
+import sys
+sys.path.insert(0, {0!r})
+from bible import Bible
+from corpus import CorpusStore
+corpus = CorpusStore.open({1!r})
+for file_path in {2!r}:
+    name = corpus.name_for(file_path)
+    if name is None or corpus.is_stale(name):
+        print("\\t".join([file_path, str(name), "not found"]))
+    else:
+        print("\\t".join([file_path, name,
+                          Bible.from_corpus(file_path, {1!r}).language]))
+"""
+
+
+def benchmark_corpus(corpus_file=None, *file_paths):
+    # Fails when the bibles of the corpus file are not found from another
+    # working directory than the one it was built from
+    corpus_file = os.path.abspath(corpus_file or CorpusStore.corpus_file)
+    if not os.path.exists(corpus_file):
+        start = timeit.default_timer()
+        count = CorpusStore.build(file_path=corpus_file)
+        print("\tbuilt {0} bibles in {1:.2f} s".format(
+                                        count, timeit.default_timer() - start))
+    file_paths = [os.path.abspath(file_path) for \
+                                    file_path in file_paths or default_files]
+    output = subprocess.check_output(
+                        [sys.executable, "-c",
+                         corpus_script.format(os.path.abspath("."),
+                                              corpus_file, file_paths)],
+                        cwd=tempfile.gettempdir(),
+                        universal_newlines=True)
+    failures = []
+    for line in output.splitlines():
+        file_path, name, language = line.split("\t")
+        print("\t{0:<40}{1}".format(name, language))
+        if language == "not found":
+            failures.append(file_path)
+    if failures:
+        print("not found in the corpus from {0}: {1}".format(
+                                                    tempfile.gettempdir(),
+                                                    ", ".join(failures)))
+        sys.exit(1)
+
+
+def benchmark_plots(*file_paths):
+    # Fails when a plot_* method of a Bible does not save its plot
+    failures = []
+    plot_folder = tempfile.mkdtemp() + os.sep
+    for file_path in file_paths or default_files[1:]:
+        bible = Bible.from_path(file_path)
+        for plot_name in plot_names:
+            os.makedirs(os.path.join(plot_folder, plot_name), exist_ok=True)
+            start = timeit.default_timer()
+            try:
+                getattr(bible, "plot_" + plot_name)(save=True,
+                                                    plot_folder=plot_folder)
+                saved = os.path.getsize(plot_file(plot_folder, plot_name,
+                                                  bible.language))
+            except Exception as error:
+                saved = "{0}: {1}".format(type(error).__name__, error)
+                failures.append("{0} {1}".format(bible.language, plot_name))
+            print("\t{0:<24}{1:>10.4f} s  {2}".format(
+                                            plot_name,
+                                            timeit.default_timer() - start,
+                                            saved))
+    if failures:
+        print("plots not saved: {0}".format(", ".join(failures)))
+        sys.exit(1)
+
+
+benchmarks = {"tokenizer": benchmark_tokenizer,
+              "hierarchy": benchmark_hierarchy,
+              "spearman": benchmark_spearman,
+              "imports": benchmark_imports,
+              "corpus": benchmark_corpus,
+              "plots": benchmark_plots}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print("usage: python benchmark.py {0} [args]".format(
+                                                "|".join(sorted(benchmarks))))
+        sys.exit(1)
+    benchmarks[sys.argv[1]](*sys.argv[2:])
@@ -1,35 +1,49 @@
 # -*- coding:utf-8 -*-
 
-try:
-    import xml.etree.cElementTree as ET
-except ImportError:
-    import xml.etree.ElementTree as ET
-
 from collections import OrderedDict
 import operator
-import re
+import os
 
-from bible_statistics import IndBibleStatistics
+from bible_statistics import IndBibleStatistics, statistic
+from reader import BibleReader
+from cache import BibleCache
+from columnar import ColumnStore
+from corpus import CorpusStore
+from counting import CountedText, TextCounts
+from tokenizer import get_tokenizer, tokenizer_for
+from vocabulary import Vocabulary
 
 
-class Verse(object):
+class Verse(CountedText):
+    # Verses, chapters and books are views over the columns of the
+    # ColumnStore of their bible: an index into the store and nothing else
     
-    def __init__(self, xml_node, parent_chapter):
-        self._id = xml_node.attrib['id']
-        self._type = xml_node.attrib['type']
-        self._parent = parent_chapter
-        
-        try:
-            self.text = xml_node.text.strip()
-        except:
-            self.text = ""
+    __slots__ = ("_store", "_index")
+    
+    _type = "verse"
+    
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+    
+    @property
+    def _id(self):
+        return self._store.verse_ids[self._index]
+    
+    @property
+    def _parent(self):
+        return Chapter(self._store, self._store.verse_chapter[self._index])
+    
+    @property
+    def text(self):
+        return self._store.texts[self._index]
         
     def __repr__(self, *args, **kwargs):
+        chapter = self._parent
         return "(Book {0}, chapter {1}, verse {2}) \n {3}".format(
-                                        all_books[self._parent._parent._id],
-                                        self._parent._parent._id,
-                                        self._parent._id,
-                                        len(self._id),
+                                        Bible.all_books[chapter._parent._id],
+                                        chapter._id,
+                                        self._id,
                                         str(self)
                                         )
         
@@ -37,157 +51,107 @@ class Verse(object):
         return self.text
     
     def tokenize(self):
-        temp_text = re.sub(r'[^\w\s]', 
-                           '', 
-                           self.text, 
-                           re.UNICODE).replace("\t", 
-                                               "").replace("\n", 
-                                                           "").lower()
-        temp = temp_text.split(" ")
-        while '' in temp:
-            temp.remove('')
-        return temp
-    
-    def unique_tokens(self):
-        return set(self.tokenize())
-    
-    def unique_chars(self):
-        #return set(list(self.text))
-        char_set = set()
-        for token in self.tokenize():
-            char_set = char_set.union(list(token))
-        char_set = char_set.difference(list("1234567890"))
-        return char_set
-    
-    def token_frequency(self):
-        res = {}
-        tokens = self.tokenize()
-        for token in tokens:
-            res[token] = res.get(token, 0) + 1
-        return res
-    
-    def char_frequency(self, lower_case):
-        res = {}
-        if lower_case:
-            chars = list(self.text.lower())
-        else:
-            chars = list(self.text)
-        for char in chars:
-            res[char] = res.get(char, 0) + 1
-        return res
+        return self._store.tokenizer.tokenize(self.text)
     
-    def token_count(self):
-        temp = self.tokenize()
-        return len(temp)
+    def counts(self):
+        return self._store.counts(self._store.verse_book(self._index),
+                                  self._index,
+                                  self._index + 1)
     
 
-class Chapter(object):
+class Chapter(CountedText):
     
-    def __init__(self, xml_node, parent_book):
-        self._id = xml_node.attrib['id']
-        self._type = xml_node.attrib['type']
-        self._parent = parent_book
-        
-        verses = []
-        for child in xml_node:
-            if child.attrib.get("type", "") == "verse" :
-                verses.append(Verse(child, self))
-                
-        self.verses = verses
+    __slots__ = ("_store", "_index")
+    
+    _type = "chapter"
+    
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+    
+    @property
+    def _id(self):
+        return self._store.chapter_ids[self._index]
+    
+    @property
+    def _parent(self):
+        return Book(self._store, self._store.chapter_book[self._index])
+    
+    def verse_range(self):
+        return self._store.chapter_verses[self._index], \
+               self._store.chapter_verses[self._index + 1]
+    
+    @property
+    def verses(self):
+        return [Verse(self._store, index) for index in \
+                                                range(*self.verse_range())]
 
     def __repr__(self, *args, **kwargs):
+        book = self._parent
         return "Book {0} ({1}), chapter {2} with {3} verses".format(
-                                                all_books[self._parent._id],
-                                                self._parent._id,
+                                                Bible.all_books[book._id],
+                                                book._id,
                                                 self._id,
                                                 len(self.verses)
                                                 )
     
-    def unique_tokens(self):
-        res = set({})
-        for verse in self.verses:
-            res = res.union(verse.unique_tokens())
-        return res
-    
-    def unique_chars(self):
-        res = set({})
-        for verse in self.verses:
-            res = res.union(verse.unique_chars())
-        return res
-    
-    def token_frequency(self):
-        res = {}
-        for verse in self.verses:
-            partial_freq = verse.token_frequency()
-            for key in partial_freq.keys():
-                res[key] = res.get(key, 0) + partial_freq[key]
-        return res
-    
-    def char_frequency(self, lower_case):
-        res = {}
-        for verse in self.verses:
-            partial_freq = verse.char_frequency(lower_case)
-            for key in partial_freq.keys():
-                res[key] = res.get(key, 0) + partial_freq[key]
-        return res
-
-    def token_count(self):
-        res = 0
-        for verse in self.verses:
-            res += verse.token_count()
-        return res
+    def counts(self):
+        # Not cached: a slice of the book's token ids is cheap to count
+        return self._store.counts(self._store.chapter_book[self._index],
+                                  *self.verse_range())
 
-class Book(object):
+class Book(CountedText):
     
-    def __init__(self, xml_node):
-        self._id = xml_node.attrib['id']
-        self._type = xml_node.attrib['type']
-        
-        chapters = []
-        for child in xml_node:
-            if child.attrib.get("type", "") == "chapter" :
-                chapters.append(Chapter(child, self))
-                
-        self.chapters = chapters
+    __slots__ = ("_store", "_index")
+    
+    _type = "book"
+    
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+    
+    @classmethod
+    def from_record(cls, record, tokenizer=None, vocabulary=None):
+        return Book(ColumnStore.from_records([record], tokenizer, vocabulary),
+                    0)
+    
+    @property
+    def _id(self):
+        return self._store.book_ids[self._index]
+    
+    @property
+    def tokenizer(self):
+        return self._store.tokenizer
+    
+    @property
+    def vocabulary(self):
+        return self._store.vocabulary
+    
+    def verse_range(self):
+        return self._store.book_verses(self._index)
+    
+    @property
+    def chapters(self):
+        store = self._store
+        return [Chapter(store, index) for index in \
+                        range(store.book_chapters[self._index],
+                              store.book_chapters[self._index + 1])]
         
     def __repr__(self, *args, **kwargs):
-        return "Book {0} ({1}) with {2} chapters".format(all_books[self._id],
-                                                   self._id,
-                                                   len(self.chapters))
-
-    def unique_tokens(self):
-        res = set({})
-        for chapter in self.chapters:
-            res = res.union(chapter.unique_tokens())
-        return res
+        return "Book {0} ({1}) with {2} chapters".format(
+                                                Bible.all_books[self._id],
+                                                self._id,
+                                                len(self.chapters))
 
-    def unique_chars(self):
-        res = set({})
-        for chapter in self.chapters:
-            res = res.union(chapter.unique_chars())
-        return res
-    
-    def token_frequency(self):
-        res = {}
-        for chapter in self.chapters:
-            partial_freq = chapter.token_frequency()
-            for key in partial_freq.keys():
-                res[key] = res.get(key, 0) + partial_freq[key]
-        return res
-    
-    def char_frequency(self, lower_case):
-        res = {}
-        for chapter in self.chapters:
-            partial_freq = chapter.char_frequency(lower_case)
-            for key in partial_freq.keys():
-                res[key] = res.get(key, 0) + partial_freq[key]
-        return res
-    
-    def token_count(self):
-        res = 0
-        for chapter in self.chapters:
-            res += chapter.token_count()
-        return res
+    def verse_texts(self):
+        return self._store.verse_texts(*self.verse_range())
+    
+    def encode(self):
+        return self._store.encode(self._index)
+    
+    def counts(self):
+        # Cached in the store
+        return self._store.counts(self._index, *self.verse_range())
 
 
 class BookSet(object):
@@ -392,12 +356,17 @@ class Bible(IndBibleStatistics):
             raise TypeError("Not a valid BookSet")
         
         self.books = book_set
+        self._counts = None
         super(Bible, self).__init__()
         
     def bible_subset(self, *book_ids):
+        # The subset shares the Book objects, and with them their cached
+        # counts, so its statistics are merged rather than recounted.
+        # Books missing from this Bible are skipped.
         books = BookSet()
         for book in self.get_book_set(*book_ids):
-            books.add(book)
+            if isinstance(book, Book):
+                books.add(book)
         return Bible(books, **self.metadata)
     
     @classmethod
@@ -413,44 +382,64 @@ class Bible(IndBibleStatistics):
         return list(key for key, value in cls.new_testament.items())
 
     @classmethod
-    def from_path(cls, file_path):
-        metadata = {}
-        metadata['file_path'] = file_path
-        
-        xml_tree = ET.ElementTree(file=file_path)
-        metadata['xml_tree'] = xml_tree
-        
-        xml_root = xml_tree.getroot()
-        xml_header, xml_text = xml_root.getchildren()
-        
-        content_info = xml_header.find("fileDesc"
-                                       ).find("extent")
-        
-        for child in content_info:
-            if child.tag == "wordCount":
-                metadata['reported_word_count'] = int(child.text)
-            else:
-                metadata['byte_count'] = int(child.text)
-        
-        language_info = xml_header.find("profileDesc"
-                                        ).find("langUsage"
-                                               ).find("language")
-                                               
-        metadata['language'] = language_info.text.strip()
-        metadata['iso639'] = language_info.attrib["iso639"].strip()
-        metadata['lang_id'] = language_info.attrib["id"].strip()
+    def from_path(cls, file_path, keep_tree=False, use_cache=True):
+        if keep_tree or not use_cache:
+            reader = BibleReader(file_path, keep_tree=keep_tree)
+            store = ColumnStore.from_records(reader.book_records())
+            metadata = reader.metadata
+            if keep_tree:
+                metadata['xml_tree'] = reader.xml_tree
+        else:
+            metadata, store = BibleCache.load(file_path)
         
-        script_info = xml_header.find("profileDesc"
-                                        ).find("wsdUsage"
-                                               ).find("writingSystem")
-        metadata['encoding'] = script_info.attrib['id']
-                
+        return Bible.from_store(store, file_path, metadata)
+    
+    @classmethod
+    def from_corpus(cls, file_path, corpus=None):
+        # Opens a bible zero-copy from the shared CorpusStore file
+        corpus = CorpusStore.open(corpus)
+        name = corpus.name_for(file_path)
+        if name is None:
+            raise KeyError("Not in the corpus: {0}".format(file_path))
+        return Bible.from_store(corpus.store(name),
+                                file_path,
+                                corpus.metadata(name))
+    
+    @classmethod
+    def from_source(cls, file_path, corpus=None):
+        # From the shared corpus file when it holds an up to date copy of
+        # the file, so processes share its pages, else from the file itself
+        if corpus is not None and os.path.exists(corpus):
+            corpus_store = CorpusStore.open(corpus)
+            name = corpus_store.name_for(file_path)
+            if name is not None and not corpus_store.is_stale(name):
+                return Bible.from_corpus(file_path, corpus)
+        return Bible.from_path(file_path)
+    
+    @classmethod
+    def from_store(cls, store, file_path, metadata):
+        metadata['file_path'] = file_path
+        metadata['tokenizer'] = tokenizer_for(metadata)
+        store.tokenizer = get_tokenizer(metadata['tokenizer'])
+        return Bible(Bible.book_set(store), **metadata)
+    
+    @classmethod
+    def book_set(cls, store):
         books = BookSet()
-        for child in xml_text.getchildren()[0]:
-            if child.attrib.get("type", "") == "book" :
-                books.add(Book(child))
-
-        return Bible(books, **metadata)
+        for index in range(store.book_count()):
+            books.add(Book(store, index))
+        return books
+    
+    @classmethod
+    def iter_books(cls, file_path):
+        # Streams the books of a file without building the whole Bible
+        reader = BibleReader(file_path)
+        vocabulary = Vocabulary()
+        for book_record in reader.book_records():
+            yield Book.from_record(
+                        book_record,
+                        get_tokenizer(tokenizer_for(reader.metadata)),
+                        vocabulary)
     
     def get_book_set(self, *args):
         for arg in args:
@@ -462,50 +451,71 @@ class Bible(IndBibleStatistics):
     def get_new_testament(self):
         return self.bible_subset(*Bible.get_new_testament_ids())
     
+    def column_store(self):
+        # The ColumnStore of the whole file the books come from, None when
+        # there are no books
+        for book in self.books.books_with_id():
+            return book._store
+        return None
+    
     def books_in_bible(self):
         return list(book_id for book_id, value in \
                             self.books._all_books.items() if \
                             not isinstance(value, str))
     
+    def partials(self, *book_ids):
+        # Cached per-book counts, the building blocks of every subset
+        return OrderedDict((book._id, book.counts()) for book in \
+                                        self.books.books_with_id(*book_ids))
+    
+    def counts(self, *book_ids):
+        if book_ids:
+            return TextCounts.merge(book.counts() for book in \
+                                        self.books.books_with_id(*book_ids))
+        if self._counts is None:
+            self._counts = TextCounts.merge(book.counts() for book in \
+                                                self.books.books_with_id())
+        return self._counts
+    
     def unique_tokens(self, *book_ids):
-        res = set({})
-        for book in self.books.books_with_id(*book_ids):
-            res = res.union(book.unique_tokens())
-        return res
+        return self.counts(*book_ids).unique_tokens()
     
     def unique_chars(self, *book_ids):
-        res = set({})
-        for book in self.books.books_with_id(*book_ids):
-            res = res.union(book.unique_chars())
-        return res
+        return self.counts(*book_ids).unique_chars()
     
     def token_frequency(self, *book_ids):
-        res = {}
-        for book in self.books.books_with_id(*book_ids):
-            partial_freq = book.token_frequency()
-            for key in partial_freq.keys():
-                res[key] = res.get(key, 0) + partial_freq[key]
+        res = self.counts(*book_ids).token_frequency
         return OrderedDict(sorted(res.items(), 
                                   key=operator.itemgetter(1),
                                   reverse=True)
                            )
     
     def char_frequency(self, lower_case, *book_ids):
-        res = {}
-        for book in self.books.books_with_id(*book_ids):
-            partial_freq = book.char_frequency(lower_case)
-            for key in partial_freq.keys():
-                res[key] = res.get(key, 0) + partial_freq[key]
+        res = self.counts(*book_ids).char_frequencies(lower_case)
         return OrderedDict(sorted(res.items(), 
                                   key=operator.itemgetter(1), 
                                   reverse=True)
                            )
     
     def token_count(self, *book_ids):
-        res = 0
-        for book in self.books.books_with_id(*book_ids):
-            res += book.token_count()
-        return res
+        return self.counts(*book_ids).token_count
+    
+    def calculate_freq_by_tok_len(self):
+        # merged from the per-book length histograms instead of a pass over
+        # the vocabulary
+        res = self.counts().length_histogram
+        return OrderedDict(sorted(res.items(), 
+                                  key=operator.itemgetter(1), 
+                                  reverse=True)
+                           )
+    
+    @statistic()
+    def mean_verse_tokens(self):
+        return self.counts().mean_verse_tokens()
+    
+    @statistic()
+    def var_verse_tokens(self):
+        return self.counts().variance_verse_tokens()
 
     def __repr__(self, *args, **kwargs):
         return "{0} (iso639={1}, {2}, {3} books)".format(self.language,
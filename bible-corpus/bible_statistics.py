@@ -1,69 +1,195 @@
 # -*- coding:utf-8 -*-
 
-import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-import scipy.stats as ss
-import Bio.Cluster as bc
-from rpy2.robjects.packages import importr
-import gc
 
+import hashlib
 import operator
 import statistics
 import math
 
 from collections import OrderedDict
 
-psych = importr("psych")
+from correlation import spearman_batch, steiger_test
+from lazy import LazyModule
+from plotting import PlotData, PlotRenderer, show_plot
+
+# only imported when a plot or a table is made, see lazy.py
+plt = LazyModule("matplotlib.pyplot")
+pd = LazyModule("pandas")
+ss = LazyModule("scipy.stats")
+bc = LazyModule("Bio.Cluster")
+
+
+class statistic(object):
+    # Statistic computed on first access and memoized. The value is stored
+    # in the instance __dict__ under the statistic's own name, so later
+    # reads are plain attribute lookups. depends_on names the statistics it
+    # is derived from, which is what IndBibleStatistics.invalidate follows.
+    
+    def __init__(self, *depends_on):
+        self.depends_on = depends_on
+    
+    def __call__(self, function):
+        self.function = function
+        self.name = function.__name__
+        return self
+    
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.function(instance)
+        instance.__dict__[self.name] = value
+        return value
 
 
 class IndBibleStatistics(object):
     
     def __init__(self, lower_case=True):
+        self.lower_case = lower_case
+    
+    @classmethod
+    def statistics(cls):
+        res = {}
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if isinstance(value, statistic):
+                    res[name] = value
+        return res
+    
+    def computed_statistics(self):
+        return [name for name in type(self).statistics() \
+                                                    if name in self.__dict__]
+    
+    def invalidate(self, *names):
+        # Forgets the given statistics (all of them if none is given) and
+        # every statistic derived from them
+        stats = type(self).statistics()
+        pending = list(names or stats)
+        dropped = set()
+        while pending:
+            name = pending.pop()
+            if name in dropped:
+                continue
+            dropped.add(name)
+            self.__dict__.pop(name, None)
+            pending.extend(other for other, stat in stats.items() \
+                                                if name in stat.depends_on)
+    
+    @statistic()
+    def chr_frequency(self):
+        return self.char_frequency(self.lower_case)
+    
+    @statistic()
+    def tok_frequency(self):
+        return self.token_frequency()
+    
+    @statistic("tok_frequency")
+    def tok_freq_by_length(self):
+        return self.calculate_token_frequencies_by_length()
+    
+    @statistic("tok_frequency")
+    def tokens_by_frequency(self):
+        return self.get_tokens_by_frequency()
+    
+    @statistic("tok_frequency")
+    def freqs_by_token_length(self):
+        return self.calculate_freq_by_tok_len()
+    
+    @statistic("tok_freq_by_length")
+    def variance_by_tok_length(self):
+        return self.calculate_variance_by_token_length()
+    
+    @statistic("tokens_by_frequency")
+    def variance_by_tok_freq(self):
+        return self.calculate_variance_by_token_freq()
+    
+    @statistic("tok_frequency")
+    def stats_digest(self):
+        return self.calculate_stats_digest()
+    
+    @statistic()
+    def total_tokens(self):
+        return self.token_count()
+    
+    @statistic()
+    def unique_char_set(self):
+        return self.unique_chars()
+    
+    @statistic()
+    def unique_token_set(self):
+        return self.unique_tokens()
+    
+    @statistic("chr_frequency")
+    def mean_char(self):
+        return statistics.mean(self.chr_frequency.values())
+    
+    @statistic("chr_frequency")
+    def var_char(self):
+        return statistics.variance(self.chr_frequency.values())
+    
+    @statistic("var_char")
+    def std_char(self):
+        return math.sqrt(self.var_char)
+    
+    @statistic("tok_frequency")
+    def mean_tok(self):
+        return statistics.mean(self.tok_frequency.values())
+    
+    @statistic("tok_frequency")
+    def var_tok(self):
+        return statistics.variance(self.tok_frequency.values())
+    
+    @statistic("var_tok")
+    def std_tok(self):
+        return math.sqrt(self.var_tok)
+    
+    @statistic("freqs_by_token_length")
+    def mean_fbtl(self):
+        return statistics.mean(self.freqs_by_token_length.values())
+    
+    @statistic("freqs_by_token_length")
+    def var_fbtl(self):
+        return statistics.variance(self.freqs_by_token_length.values())
+    
+    @statistic("var_fbtl")
+    def std_fbtl(self):
+        return math.sqrt(self.var_fbtl)
+    
+    @statistic("chr_frequency", "mean_char", "std_char")
+    def z_scores_char(self):
+        return self.calculate_z_scores(self.chr_frequency, 
+                                       self.mean_char, 
+                                       self.std_char)
+    
+    @statistic("tok_frequency", "mean_tok", "std_tok")
+    def z_scores_tok(self):
+        return self.calculate_z_scores(self.tok_frequency, 
+                                       self.mean_tok, 
+                                       self.std_tok)
+    
+    @statistic("freqs_by_token_length", "mean_fbtl", "std_fbtl")
+    def z_scores_fbtl(self):
+        return self.calculate_z_scores(self.freqs_by_token_length,
+                                       self.mean_fbtl, 
+                                       self.std_fbtl)
 
-        self.char_frequency = self.char_frequency(lower_case)
-        
-        self.tok_frequency = self.token_frequency()
-        self.tok_freq_by_length = self.calculate_token_frequencies_by_length()
-        self.tokens_by_frequency = self.get_tokens_by_frequency()
-        self.freqs_by_token_length = self.calculate_freq_by_tok_len()
-        
-        self.variance_by_tok_length = self.calculate_variance_by_token_length()
-        self.variance_by_tok_freq = self.calculate_variance_by_token_freq()
-        
-        self.total_tokens = self.token_count()
-        
-        self.unique_chars = self.unique_chars()
-        self.unique_tokens = self.unique_tokens()
-        
-        self.mean_char = statistics.mean(self.char_frequency.values())
-        self.var_char = statistics.variance(self.char_frequency.values())
-        self.std_char = math.sqrt(self.var_char)
-        
-        self.mean_tok = statistics.mean(self.tok_frequency.values())
-        self.var_tok = statistics.variance(self.tok_frequency.values())
-        self.std_tok = math.sqrt(self.var_tok)
-        
-        self.mean_fbtl = statistics.mean(self.freqs_by_token_length.values())
-        self.var_fbtl = statistics.variance(
-                                            self.freqs_by_token_length.values()
-                                            )
-        self.std_fbtl = math.sqrt(self.var_fbtl)
-        
-        self.z_scores_char = self.calculate_z_scores(self.char_frequency, 
-                                                     self.mean_char, 
-                                                     self.std_char)
-        
-        self.z_scores_tok = self.calculate_z_scores(self.tok_frequency, 
-                                                    self.mean_tok, 
-                                                    self.std_tok)
-        
-        self.z_scores_fbtl = self.calculate_z_scores(
-                                                    self.freqs_by_token_length,
-                                                    self.mean_fbtl, 
-                                                    self.std_fbtl
-                                                    )
-
+    # Attributes that BibleSummary carries across process boundaries
+    summary_fields = ["tok_frequency",
+                      "tok_freq_by_length",
+                      "tokens_by_frequency",
+                      "freqs_by_token_length",
+                      "variance_by_tok_length",
+                      "variance_by_tok_freq",
+                      "total_tokens",
+                      "stats_digest"]
+    
+    def summary(self):
+        state = {key: value for key, value in self.metadata.items() \
+                                                    if key != "xml_tree"}
+        for field in IndBibleStatistics.summary_fields:
+            state[field] = getattr(self, field)
+        return BibleSummary(**state)
+    
     def calculate_freq_by_tok_len(self):
         res = {}
         for token, freq in self.tok_frequency.items():
@@ -73,6 +199,14 @@ class IndBibleStatistics(object):
                                   reverse=True)
                            )
     
+    def calculate_stats_digest(self):
+        # Hash of the language and its token frequencies, which the other
+        # statistics, the plots and the tables are made from
+        lines = ["{0}\t{1}".format(token, frequency) for token, frequency in \
+                                            sorted(self.tok_frequency.items())]
+        lines.insert(0, self.language)
+        return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+    
     def calculate_z_scores(self, data_dict, mean, std):
         res = data_dict.copy()
         for key, value in res.items():
@@ -149,313 +283,63 @@ class IndBibleStatistics(object):
     
     def plot_freq_long(self, annotated=False, save=True, 
                        plot_folder="../plots/", 
-                       sub_folder="freq_long/"):
-        folder = plot_folder + sub_folder
-        dataset = [(token, frequency, len(token)) for token, frequency in \
-                                                    self.tok_frequency.items()]
-        label_set = {}
-        for label, x, y in dataset:
-            x_coord = label_set.get(x, {})
-            xy_coord = x_coord.get(y, set([]))
-            xy_coord.add(label)
-            
-            x_coord[y] = xy_coord
-            label_set[x] = x_coord
-            
-        if save:
-            #plt.figure(figsize=(33.1, 46.8))
-            #plt.plot()
-            #plt.figure(figsize=(46.8, 33.1), dpi=300)
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        plt.yticks(range(max(self.tok_freq_by_length) + 1))
-        #res = np.logspace(np.log10(0.01), np.log10(max(self.tokens_by_frequency)))
-        x_distance = min(max(self.tokens_by_frequency), 15)
-        res = [n for n in range(0, 
-                                max(self.tokens_by_frequency), 
-                                int(max(self.tokens_by_frequency)/x_distance)
-                                )
-               ]
-        plt.xticks(res)
-        
-        # X frequency Y length 
-        ndataset = np.array(dataset)
-        plt.scatter(np.array(ndataset[:, 1], dtype=np.int32), 
-                    np.array(ndataset[:, 2], dtype=np.int32),
-                    marker = 'o',)
-        
-        if annotated:
-            for label, x, y in dataset:
-                try:
-                    plt.annotate(str(label_set[x][y]),
-                                 xy=(x, y))
-                    del label_set[x][y]
-                except:
-                    pass
-                
-        plt.ylabel("Token Length")
-        plt.xlabel("Token Frequency")
-        plt.title(self.language)
-        plt.xlim(xmin=0)
-        plt.ylim(ymin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+                       sub_folder="freq_long/", density=False, top=0):
+        self.draw_plot("freq_long", annotated, save, plot_folder + sub_folder,
+                       density, top)
     
     def plot_freq_meanlong_novar(self, annotated=False, save=True,
                            plot_folder="../plots/", 
                            sub_folder="freq_meanlong_novar/"):
-        folder = plot_folder + sub_folder
-        dataset = []
-        for freq, tokens in self.tokens_by_frequency.items():
-            if self.variance_by_tok_freq[freq] != None: # Variance is None
-                len_values = []
-                for token in tokens:
-                    len_values.append(len(token))
-                mean_val = statistics.mean(len_values)
-                dataset.append((freq, mean_val))
-                
-
-        if save:
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        # X frequency Y mean length 
-        ndataset = np.array(sorted(dataset))
-        plt.bar(np.array(ndataset[:, 0], dtype=np.int32), 
-                np.array(ndataset[:, 1], dtype=np.float32))
-        
-        plt.ylabel("Mean of Token Lengths")
-        plt.xlabel("Token Frequency")
-        plt.title(self.language)
-        plt.xlim(xmin=0)
-        plt.ylim(ymin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+        self.draw_plot("freq_meanlong_novar", annotated, save,
+                       plot_folder + sub_folder)
             
     def plot_freq_varlong_novar(self, save=True, 
                           plot_folder="../plots/", 
                           sub_folder="freq_varlong_novar/"):
-        folder = plot_folder + sub_folder
-        dataset = [(frequency, l_variance) for frequency, l_variance in \
-                                            self.variance_by_tok_freq.items()
-                                            if l_variance != None]
-        
-        if save:
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        # X frequency Y length 
-        ndataset = np.array(dataset)
-        plt.bar(np.array(ndataset[:, 0], dtype=np.int32), 
-                np.array(ndataset[:, 1], dtype=np.float32))
-        
-        plt.ylabel("Variance of Token Lengths by Frequency")
-        plt.xlabel("Token Frequency")
-        plt.title(self.language)
-        plt.xlim(xmin=0)
-        plt.ylim(ymin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+        self.draw_plot("freq_varlong_novar", False, save,
+                       plot_folder + sub_folder)
         
     def plot_freq_meanlong_var0(self, annotated=False, save=True,
                            plot_folder="../plots/", 
                            sub_folder="freq_meanlong_var0/"):
-        folder = plot_folder + sub_folder
-        dataset = []
-        for freq, tokens in self.tokens_by_frequency.items():
-            len_values = []
-            for token in tokens:
-                len_values.append(len(token))
-            mean_val = statistics.mean(len_values)
-            dataset.append((freq, mean_val))
-            
-        if save:
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        # X frequency Y mean length 
-        ndataset = np.array(sorted(dataset))
-        plt.bar(np.array(ndataset[:, 0], dtype=np.int32), 
-                np.array(ndataset[:, 1], dtype=np.float32))
-        
-        plt.ylabel("Mean of Token Lengths")
-        plt.xlabel("Token Frequency")
-        plt.title(self.language)
-        plt.xlim(xmin=0)
-        plt.ylim(ymin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+        self.draw_plot("freq_meanlong_var0", annotated, save,
+                       plot_folder + sub_folder)
             
     def plot_freq_varlong_var0(self, save=True, 
                           plot_folder="../plots/", 
                           sub_folder="freq_varlong_var0/"):
-        folder = plot_folder + sub_folder
-        dataset = [(frequency, l_variance) for frequency, l_variance in \
-                                            self.variance_by_tok_freq.items()]
-        dataset = np.nan_to_num(np.array(sorted(dataset),
-                                         dtype=np.float)
-                                )
-        
-        if save:
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        # X frequency Y length 
-        ndataset = np.array(dataset)
-        plt.bar(np.array(ndataset[:, 0], dtype=np.int32), 
-                np.array(ndataset[:, 1], dtype=np.float32))
-        
-        plt.ylabel("Variance of Token Lengths by Frequency")
-        plt.xlabel("Token Frequency")
-        plt.title(self.language)
-        plt.xlim(xmin=0)
-        plt.ylim(ymin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+        self.draw_plot("freq_varlong_var0", False, save,
+                       plot_folder + sub_folder)
 
     def plot_long_freq(self, annotated=False, save=True, 
                        plot_folder="../plots/", 
-                       sub_folder="long_freq/"):
-        folder = plot_folder + sub_folder
-        dataset = [(token, frequency, len(token)) for token, frequency in \
-                                                    self.tok_frequency.items()]
-        label_set = {}
-        for label, x, y in dataset:
-            x_coord = label_set.get(x, {})
-            xy_coord = x_coord.get(y, set([]))
-            xy_coord.add(label)
-            
-            x_coord[y] = xy_coord
-            label_set[x] = x_coord
-            
-        if save:
-            #plt.figure(figsize=(33.1, 46.8))
-            #plt.plot()
-            #plt.figure(figsize=(46.8, 33.1), dpi=300)
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        plt.xticks(range(max(self.tok_freq_by_length) + 1))
-        #res = np.logspace(np.log10(0.01), np.log10(max(self.tokens_by_frequency)))
-        y_distance = min(max(self.tokens_by_frequency), 15)
-        res = [n for n in range(0, 
-                                max(self.tokens_by_frequency), 
-                                int(max(self.tokens_by_frequency)/y_distance)
-                                )
-               ]
-        plt.yticks(res)
-        
-        # Y frequency X length 
-        ndataset = np.array(dataset)
-        plt.scatter(np.array(ndataset[:, 2], dtype=np.int32), 
-                    np.array(ndataset[:, 1], dtype=np.int32),
-                    marker = 'o',)
-        
-        if annotated:
-            for label, y, x in dataset:
-                try:
-                    plt.annotate(str(label_set[x][y]),
-                                 xy=(x, y))
-                    del label_set[x][y]
-                except:
-                    pass
-                
-        plt.xlabel("Token Length")
-        plt.ylabel("Token Frequency")
-        plt.title(self.language)
-        plt.ylim(ymin=0)
-        plt.xlim(xmin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+                       sub_folder="long_freq/", density=False, top=0):
+        self.draw_plot("long_freq", annotated, save, plot_folder + sub_folder,
+                       density, top)
         
     def plot_long_varfreq_novar(self, save=True, 
                           plot_folder="../plots/", 
                           sub_folder="long_varfreq_novar/"):
-        folder = plot_folder + sub_folder
-
-        dataset = [(token_length, f_variance) for token_length, f_variance in \
-                                        self.variance_by_tok_length.items()\
-                                        if f_variance != None]
-            
-        if save:
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        plt.xticks(range(max(self.variance_by_tok_length) + 1))
-        # Y varfrequency X length 
-        ndataset = np.array(dataset)
-        plt.bar(np.array(ndataset[:, 0], dtype=np.int32), 
-                np.array(ndataset[:, 1], dtype=np.float32))
-        
-        plt.xlabel("Token Length")
-        plt.ylabel("Variance of Token Frequency by Length")
-        plt.title(self.language)
-        plt.ylim(ymin=0)
-        plt.xlim(xmin=0)
-        if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
-        else:
-            plt.show()
-        plt.close()
-        gc.collect()
+        self.draw_plot("long_varfreq_novar", False, save,
+                       plot_folder + sub_folder)
         
     def plot_long_varfreq_var0(self, save=True, 
                           plot_folder="../plots/", 
                           sub_folder="long_varfreq_var0/"):
-        folder = plot_folder + sub_folder
-
-        dataset = [(token_length, f_variance) for token_length, f_variance in \
-                                        self.variance_by_tok_length.items()]
-        dataset = np.nan_to_num(np.array(sorted(dataset),
-                                         dtype=np.float)
-                                )
-            
-        if save:
-            fig = plt.figure(figsize=(11.69, 8.27))
-        
-        plt.xticks(range(max(self.variance_by_tok_length) + 1))
-        # Y varfrequency X length 
-        ndataset = np.array(dataset)
-        plt.bar(np.array(ndataset[:, 0], dtype=np.int32), 
-                np.array(ndataset[:, 1], dtype=np.float32))
-        
-        plt.xlabel("Token Length")
-        plt.ylabel("Variance of Token Frequency by Length")
-        plt.title(self.language)
-        plt.ylim(ymin=0)
-        plt.xlim(xmin=0)
+        self.draw_plot("long_varfreq_var0", False, save,
+                       plot_folder + sub_folder)
+    
+    def draw_plot(self, plot_name, annotated, save, folder, density=False,
+                  top=0):
+        # One plot of plotting.py, saved as folder + language + ".png" or
+        # shown. To make all of them, plotting.render_plots computes the
+        # datasets once.
         if save:
-            plt.savefig(folder + self.language)
-            fig.clf()
+            PlotRenderer.shared().save(PlotData(self), plot_name,
+                                       folder + self.language + ".png",
+                                       annotated, density, top)
         else:
-            plt.show()
-        plt.close()
-        gc.collect()
+            show_plot(self, plot_name, annotated, density, top)
     
     def plot(self):
         d = OrderedDict(sorted(self.freqs_by_token_length.items(), 
@@ -471,8 +355,31 @@ class IndBibleStatistics(object):
         plt.show()
     
 
+class BibleSummary(IndBibleStatistics):
+    # Picklable snapshot of the statistics of one Bible, used to hand the
+    # results of worker processes back to a BibleGroup
+    
+    def __init__(self, **state):
+        self.metadata = {key: value for key, value in state.items() \
+                            if key not in IndBibleStatistics.summary_fields}
+        for key, value in state.items():
+            setattr(self, key, value)
+    
+    def token_count(self):
+        return self.total_tokens
+    
+    def __repr__(self, *args, **kwargs):
+        return "Summary of {0} (iso639={1}, {2} tokens)".format(
+                                                        self.language,
+                                                        self.iso639,
+                                                        self.total_tokens)
+
+
 class BibleGroup(object):
     
+    # version of the tables (to_dataframe, spearman_dataframe) for Manifest
+    table_version = 1
+    
     def __init__(self):
         self.bibles = []
         
@@ -480,6 +387,9 @@ class BibleGroup(object):
         self.length_set = set()
         self.freq_set = set()
         
+        # to_dataframe results by layout
+        self._dataframes = {}
+        
     
     def calculate_freq_length_sets(self):
         for bible in self.bibles:
@@ -534,10 +444,86 @@ class BibleGroup(object):
         plt.xticks(x)
         plt.show()
     
+    def stats_digest(self):
+        # Hash of the bibles of the group, in order
+        return hashlib.sha1("\n".join(bible.stats_digest for bible in \
+                                            self.bibles).encode("utf-8")
+                            ).hexdigest()
+    
     def add(self, bible):
         if not isinstance(bible, IndBibleStatistics):
             raise TypeError("Not correct IndBibleStatistics type")
         self.bibles.append(bible)
+        self._dataframes.clear()
+    
+    @classmethod
+    def spearman_series(cls, bible, relationships=None):
+        # (x, y) arrays of the given relationships (all of them by default),
+        # NaN where a variance is None. NaN pairs are left out of the
+        # correlation, so the _NOVAR0 series only keep the points with a
+        # variance and the _VAR0 ones take a None variance as zero.
+        # The tokens are only gone through for the ones that need them.
+        freqs = sorted(bible.variance_by_tok_freq)
+        freq_array = np.array(freqs, dtype=float)
+        len_variances = np.array([bible.variance_by_tok_freq[freq] for \
+                                                freq in freqs], dtype=float)
+        lengths = sorted(bible.variance_by_tok_length)
+        freq_variances = np.array([bible.variance_by_tok_length[length] for \
+                                                length in lengths], dtype=float)
+        lengths = np.array(lengths, dtype=float)
+        
+        series = OrderedDict()
+        series["StrLen_VarFreq_NOVAR0"] = (lengths, freq_variances)
+        series["Freq_VarStrLen_NOVAR0"] = (freq_array, len_variances)
+        series["StrLen_VarFreq_VAR0"] = (lengths,
+                                         np.nan_to_num(freq_variances))
+        series["Freq_VarStrLen_VAR0"] = (freq_array,
+                                         np.nan_to_num(len_variances))
+        if relationships is not None and \
+           all(relationship in series for relationship in relationships):
+            return series
+        
+        tokens = bible.tok_frequency
+        token_freqs = np.fromiter(tokens.values(), dtype=np.int64,
+                                  count=len(tokens))
+        token_lengths = np.fromiter(map(len, tokens), dtype=np.int64,
+                                    count=len(tokens))
+        # the token frequencies are the keys of variance_by_tok_freq
+        inverse = np.searchsorted(freqs, token_freqs)
+        mean_lengths = np.bincount(inverse, weights=token_lengths) / \
+                       np.bincount(inverse)
+        with_variance = np.where(np.isnan(len_variances), np.nan, 1)
+        
+        # X frequencies Y lengths
+        series["Freq_StrLen"] = (token_freqs.astype(float),
+                                 token_lengths.astype(float))
+        series["Freq_MeanStrLen_NOVAR0"] = (freq_array,
+                                            mean_lengths * with_variance)
+        series["VarStrLen_MeanStrLen_NOVAR0"] = (len_variances, mean_lengths)
+        series["Freq_MeanStrLen_VAR0"] = (freq_array, mean_lengths)
+        series["VarStrLen_MeanStrLen_VAR0"] = (np.nan_to_num(len_variances),
+                                               mean_lengths)
+        return series
+    
+    def spearman_table(self, relationships, **renames):
+        # Rho_ and P_ columns of the given relationships for every language,
+        # each relationship computed for all the languages in one batch.
+        # A language seen twice keeps its first position and last values.
+        # renames maps a relationship to the name used in the columns.
+        bibles = OrderedDict()
+        for bible in self.bibles:
+            bibles[bible.language] = bible
+        series = [BibleGroup.spearman_series(bible, relationships) for \
+                                                    bible in bibles.values()]
+        columns = OrderedDict()
+        for relationship in relationships:
+            rho, p = spearman_batch([xy[relationship][0] for xy in series],
+                                    [xy[relationship][1] for xy in series])
+            name = renames.get(relationship, relationship)
+            columns["Rho_" + name] = rho
+            columns["P_" + name] = p
+        table = pd.DataFrame(columns, index=list(bibles))
+        return table, series
     
     def spearman_dataframe(self):
         # Efectivament |Rho_Freq_StrLen| < |Rho_Freq_MeanStrLen| < |Rho_Freq_VarStrLen|, 
@@ -552,272 +538,67 @@ class BibleGroup(object):
         # significativa. Poso la mà al foc a què ho és perquè de forma sistemàtica 
         # en diferents llengües tenim |Rho_Freq_MeanStrLen| < |Rho_Freq_VarStrLen|
         
-        df = self.to_dataframe()
-        
-        res = pd.DataFrame(columns=["Rho_Freq_StrLen", 
-                                    "P_Freq_StrLen",
-                                    
-                                    "Rho_StrLen_VarFreq_NOVAR0", 
-                                    "P_StrLen_VarFreq_NOVAR0",
-                                    "Rho_Freq_VarStrLen_NOVAR0",
-                                    "P_Freq_VarStrLen_NOVAR0",
-                                    "Rho_Freq_MeanStrLen_NOVAR0",
-                                    "P_Freq_MeanStrLen_NOVAR0",
-                                    "Rho_VarStrLen_MeanStrLen_NOVAR0",
-                                    "P_VarStrLen_MeanStrLen_NOVAR0",
-                                    
-                                    "Steiger_t_Freq_VarStrLen_MeanStrLen_NOVAR0",
-                                    "Steiger_p_Freq_VarStrLen_MeanStrLen_NOVAR0",
-                                    
-                                    "Rho_StrLen_VarFreq_VAR0", 
-                                    "P_StrLen_VarFreq_VAR0",
-                                    "Rho_Freq_VarStrLen_VAR0",
-                                    "P_Freq_VarStrLen_VAR0",
-                                    "Rho_Freq_MeanStrLen_VAR0",
-                                    "P_Freq_MeanStrLen_VAR0",
-                                    "Rho_VarStrLen_MeanStrLen_VAR0",
-                                    "P_VarStrLen_MeanStrLen_VAR0",
-                                    
-                                    "Steiger_t_Freq_VarStrLen_MeanStrLen_VAR0",
-                                    "Steiger_p_Freq_VarStrLen_MeanStrLen_VAR0"
-                                    ])
-        
-        for bible in self.bibles:
-            row_res = {}
-            
-            # X frequencies Y lengths 
-            dataset = []
-            for freq, tokens in bible.tokens_by_frequency.items():
-                for token in tokens:
-                    dataset.append((freq, len(token)))
-        
-            freq_len_dset = np.array(sorted(dataset))
-            sper_freq_len_dset = self.spearmanr(freq_len_dset[:, 0], 
-                                                freq_len_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_Freq_StrLen"] = sper_freq_len_dset[0]
-            row_res["P_Freq_StrLen"] = sper_freq_len_dset[1]
-
-            # X length Y frequency variance is None
-            dataset = [(token_length, f_variance) for token_length, f_variance in \
-                                        bible.variance_by_tok_length.items()\
-                                        if f_variance != None]
-            
-            len_fvar_dset = np.array(sorted(dataset))
-            sper_len_fvar_dset = self.spearmanr(len_fvar_dset[:, 0], 
-                                                len_fvar_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_StrLen_VarFreq_NOVAR0"] = sper_len_fvar_dset[0]
-            row_res["P_StrLen_VarFreq_NOVAR0"] = sper_len_fvar_dset[1]
-
-            
-            # X frequency Y length_variance when varstrlen is None
-            dataset = [(frequency, l_variance) for frequency, l_variance in \
-                                            bible.variance_by_tok_freq.items()
-                                            if l_variance != None]
-            
-            freq_lvar_dset = np.array(sorted(dataset))
-            sper_freq_lvar_dset = self.spearmanr(freq_lvar_dset[:, 0], 
-                                                 freq_lvar_dset[:, 1], 
-                                                 True)
-            
-            row_res["Rho_Freq_VarStrLen_NOVAR0"] = sper_freq_lvar_dset[0]
-            row_res["P_Freq_VarStrLen_NOVAR0"] = sper_freq_lvar_dset[1]
-            
-            # X frequencies Y Mean Lengths when varstrlen is None
-            dataset = []
-            for freq, tokens in bible.tokens_by_frequency.items():
-                if bible.variance_by_tok_freq[freq] != None: # Variance is None
-                    len_values = []
-                    for token in tokens:
-                        len_values.append(len(token))
-                    mean_val = statistics.mean(len_values)
-                    dataset.append((freq, mean_val))
-            
-            freq_mlen_dset = np.array(sorted(dataset))
-            sper_freq_mlen_dset = self.spearmanr(freq_mlen_dset[:, 0], 
-                                                freq_mlen_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_Freq_MeanStrLen_NOVAR0"] = sper_freq_mlen_dset[0]
-            row_res["P_Freq_MeanStrLen_NOVAR0"] = sper_freq_mlen_dset[1]
-            
-            # X length_variance Y mean lengths when varstrlen is None
-            lvar_mlen_dset = np.column_stack((freq_lvar_dset[:, 1],
-                                              freq_mlen_dset[:, 1]))
-            sper_lvar_mlen_dset = self.spearmanr(lvar_mlen_dset[:, 0],
-                                                 lvar_mlen_dset[:, 1],
-                                                 True)
-            row_res["Rho_VarStrLen_MeanStrLen_NOVAR0"] = sper_lvar_mlen_dset[0]
-            row_res["P_VarStrLen_MeanStrLen_NOVAR0"] = sper_lvar_mlen_dset[1]
-            
-            # Steiger's Z
-            steiger = psych.r_test(n=len(lvar_mlen_dset), 
-                                   r12=row_res["Rho_Freq_VarStrLen_NOVAR0"], 
-                                   r13=row_res["Rho_Freq_MeanStrLen_NOVAR0"], 
-                                   r23=row_res["Rho_VarStrLen_MeanStrLen_NOVAR0"]
-                                   )
-            row_res["Steiger_t_Freq_VarStrLen_MeanStrLen_NOVAR0"] = steiger[2][0]
-            row_res["Steiger_p_Freq_VarStrLen_MeanStrLen_NOVAR0"] = steiger[3][0]
-
-            
-            ########
-            
-            # X length Y frequency variance as zero
-            dataset = [(token_length, f_variance) for token_length, f_variance in \
-                                        bible.variance_by_tok_length.items()]
-            
-            len_fvar_dset = np.nan_to_num(np.array(sorted(dataset),
-                                                   dtype=np.float)
-                                           )
-            sper_len_fvar_dset = self.spearmanr(len_fvar_dset[:, 0], 
-                                                len_fvar_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_StrLen_VarFreq_VAR0"] = sper_len_fvar_dset[0]
-            row_res["P_StrLen_VarFreq_VAR0"] = sper_len_fvar_dset[1]
-            
-            # X frequency Y length_variance varstrl as zero
-            dataset = [(frequency, l_variance) for frequency, l_variance in \
-                                            bible.variance_by_tok_freq.items()]
-            
-            freq_lvar_dset = np.nan_to_num(np.array(sorted(dataset), 
-                                                    dtype=np.float)
-                                           )
-            sper_freq_lvar_dset = self.spearmanr(freq_lvar_dset[:, 0], 
-                                                 freq_lvar_dset[:, 1], 
-                                                 True)
-            row_res["Rho_Freq_VarStrLen_VAR0"] = sper_freq_lvar_dset[0]
-            row_res["P_Freq_VarStrLen_VAR0"] = sper_freq_lvar_dset[1]
-            
-            # X frequencies Y Mean Lengths varstrl as zero
-            dataset = []
-            for freq, tokens in bible.tokens_by_frequency.items():
-                len_values = []
-                for token in tokens:
-                    len_values.append(len(token))
-                mean_val = statistics.mean(len_values)
-                dataset.append((freq, mean_val))
-            
-            freq_mlen_dset = np.array(sorted(dataset))
-            sper_freq_mlen_dset = self.spearmanr(freq_mlen_dset[:, 0], 
-                                                freq_mlen_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_Freq_MeanStrLen_VAR0"] = sper_freq_mlen_dset[0]
-            row_res["P_Freq_MeanStrLen_VAR0"] = sper_freq_mlen_dset[1]
-            
-            # X length_variance Y mean lengths varstrl as zero
-            lvar_mlen_dset = np.column_stack((freq_lvar_dset[:, 1],
-                                              freq_mlen_dset[:, 1]))
-            sper_lvar_mlen_dset = self.spearmanr(lvar_mlen_dset[:, 0],
-                                                 lvar_mlen_dset[:, 1],
-                                                 True)
-            row_res["Rho_VarStrLen_MeanStrLen_VAR0"] = sper_lvar_mlen_dset[0]
-            row_res["P_VarStrLen_MeanStrLen_VAR0"] = sper_lvar_mlen_dset[1]
-            
-            # Steiger's Z
-            steiger = psych.r_test(n=len(lvar_mlen_dset), 
-                                   r12=row_res["Rho_Freq_VarStrLen_VAR0"], 
-                                   r13=row_res["Rho_Freq_MeanStrLen_VAR0"], 
-                                   r23=row_res["Rho_VarStrLen_MeanStrLen_VAR0"]
-                                   )
-            row_res["Steiger_t_Freq_VarStrLen_MeanStrLen_VAR0"] = steiger[2][0]
-            row_res["Steiger_p_Freq_VarStrLen_MeanStrLen_VAR0"] = steiger[3][0]
-                        
-            res.loc[bible.language] = pd.Series(row_res)
-        
-        return res
+        variants = ["NOVAR0", "VAR0"]
+        relationships = ["Freq_StrLen"]
+        for variant in variants:
+            relationships += [name + "_" + variant for name in \
+                                                ["StrLen_VarFreq",
+                                                 "Freq_VarStrLen",
+                                                 "Freq_MeanStrLen",
+                                                 "VarStrLen_MeanStrLen"]]
+        table, series = self.spearman_table(relationships)
+        
+        # Steiger's Z
+        for variant in variants:
+            counts = [np.count_nonzero(~(np.isnan(x) | np.isnan(y))) for \
+                        x, y in (xy["VarStrLen_MeanStrLen_" + variant] for \
+                                                            xy in series)]
+            t, p = steiger_test(counts,
+                                table["Rho_Freq_VarStrLen_" + variant].values,
+                                table["Rho_Freq_MeanStrLen_" + variant].values,
+                                table["Rho_VarStrLen_MeanStrLen_" + \
+                                                            variant].values)
+            table["Steiger_t_Freq_VarStrLen_MeanStrLen_" + variant] = t
+            table["Steiger_p_Freq_VarStrLen_MeanStrLen_" + variant] = p
+        
+        return table[["Rho_Freq_StrLen", 
+                      "P_Freq_StrLen",
+                      
+                      "Rho_StrLen_VarFreq_NOVAR0", 
+                      "P_StrLen_VarFreq_NOVAR0",
+                      "Rho_Freq_VarStrLen_NOVAR0",
+                      "P_Freq_VarStrLen_NOVAR0",
+                      "Rho_Freq_MeanStrLen_NOVAR0",
+                      "P_Freq_MeanStrLen_NOVAR0",
+                      "Rho_VarStrLen_MeanStrLen_NOVAR0",
+                      "P_VarStrLen_MeanStrLen_NOVAR0",
+                      
+                      "Steiger_t_Freq_VarStrLen_MeanStrLen_NOVAR0",
+                      "Steiger_p_Freq_VarStrLen_MeanStrLen_NOVAR0",
+                      
+                      "Rho_StrLen_VarFreq_VAR0", 
+                      "P_StrLen_VarFreq_VAR0",
+                      "Rho_Freq_VarStrLen_VAR0",
+                      "P_Freq_VarStrLen_VAR0",
+                      "Rho_Freq_MeanStrLen_VAR0",
+                      "P_Freq_MeanStrLen_VAR0",
+                      "Rho_VarStrLen_MeanStrLen_VAR0",
+                      "P_VarStrLen_MeanStrLen_VAR0",
+                      
+                      "Steiger_t_Freq_VarStrLen_MeanStrLen_VAR0",
+                      "Steiger_p_Freq_VarStrLen_MeanStrLen_VAR0"
+                      ]]
         
     def spearman_var_dataframe(self):
-        df = self.to_dataframe()
-        
-        res = pd.DataFrame(columns=["Rho_StrLen_VarFreq", 
-                                    "P_StrLen_VarFreq",
-                                    "Rho_Freq_VarStrLen", 
-                                    "P_Freq_VarStrLen",
-                                    ])
-        
-        for bible in self.bibles:
-            row_res = {}
-            
-            dataset = [(token_length, f_variance) for token_length, f_variance in \
-                                        bible.variance_by_tok_length.items()\
-                                        if f_variance != None]
-            
-            len_fvar_dset = np.array(sorted(dataset))
-            sper_len_fvar_dset = self.spearmanr(len_fvar_dset[:, 0], 
-                                                len_fvar_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_StrLen_VarFreq"] = sper_len_fvar_dset[0]
-            row_res["P_StrLen_VarFreq"] = sper_len_fvar_dset[1]
-            
-            dataset = [(frequency, l_variance) for frequency, l_variance in \
-                                            bible.variance_by_tok_freq.items()
-                                            if l_variance != None]
-        
-            # X frequency Y length_variance 
-            freq_lvar_dset = np.array(sorted(dataset))
-            sper_freq_lvar_dset = self.spearmanr(freq_lvar_dset[:, 0], 
-                                                 freq_lvar_dset[:, 1], 
-                                                 True)
-            
-            row_res["Rho_Freq_VarStrLen"] = sper_freq_lvar_dset[0]
-            row_res["P_Freq_VarStrLen"] = sper_freq_lvar_dset[1]
-            
-            res.loc[bible.language] = pd.Series(row_res)
-        
-        return res
+        return self.spearman_table(
+                        ["StrLen_VarFreq_NOVAR0", "Freq_VarStrLen_NOVAR0"],
+                        StrLen_VarFreq_NOVAR0="StrLen_VarFreq",
+                        Freq_VarStrLen_NOVAR0="Freq_VarStrLen")[0]
     
     def spearman_novar_dataframe(self):
-        df = self.to_dataframe()
-        
-        res = pd.DataFrame(columns=["Rho_Freq_StrLen", 
-                                    "P_Freq_StrLen",
-                                    "Rho_Freq_MeanStrLen", 
-                                    "P_Freq_MeanStrLen"
-                                    ])
-        
-        for bible in self.bibles:
-
-            row_res = {}
-            dataset = []
-            for freq, tokens in bible.tokens_by_frequency.items():
-                for token in tokens:
-                    dataset.append((freq, len(token)))
-        
-            # X frequencies Y lengths
-            freq_len_dset = np.array(sorted(dataset))
-            sper_freq_len_dset = self.spearmanr(freq_len_dset[:, 0], 
-                                                freq_len_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_Freq_StrLen"] = sper_freq_len_dset[0]
-            row_res["P_Freq_StrLen"] = sper_freq_len_dset[1]
-            
-            dataset = []
-            for freq, tokens in bible.tokens_by_frequency.items():
-                len_values = []
-                for token in tokens:
-                    len_values.append(len(token))
-                mean_val = statistics.mean(len_values)
-                dataset.append((freq, mean_val))
-            
-            # X frequencies Y Mean Lengths
-            freq_mlen_dset = np.array(sorted(dataset))
-            sper_freq_mlen_dset = self.spearmanr(freq_mlen_dset[:, 0], 
-                                                freq_mlen_dset[:, 1], 
-                                                True)
-            
-            row_res["Rho_Freq_MeanStrLen"] = sper_freq_mlen_dset[0]
-            row_res["P_Freq_MeanStrLen"] = sper_freq_mlen_dset[1]
-            
-            res.loc[bible.language] = pd.Series(row_res)
-        
-        return res
+        return self.spearman_table(
+                        ["Freq_StrLen", "Freq_MeanStrLen_VAR0"],
+                        Freq_MeanStrLen_VAR0="Freq_MeanStrLen")[0]
 
     def spearmanr(self, array1, array2, with_scipy=True):
         x1 = np.ma.masked_invalid(array1)
@@ -830,8 +611,61 @@ class BibleGroup(object):
         else:
             return bc.distancematrix((k, j), dist="s")
         
-    def to_dataframe(self):
-        dataframe = pd.DataFrame(columns=self.column_headers)
+    def records(self):
+        # as_dict of every bible by language; a language seen twice keeps
+        # its first position and its last values
+        records = OrderedDict()
         for bible in self.bibles:
-            dataframe.loc[bible.language] = pd.Series(bible.as_dict())
-        return dataframe
\ No newline at end of file
+            records[bible.language] = bible.as_dict()
+        return records
+    
+    def to_dataframe(self, layout="wide"):
+        # One row per language and one float64 column per header, missing
+        # values as NaN. The "sparse" layout stores the same frame with
+        # sparse columns and the "long" one has a (language, variable,
+        # value) row for every value present. Frames are built once and
+        # kept until a bible is added; they must not be modified in place.
+        if layout not in self._dataframes:
+            if layout == "wide":
+                dataframe = self._wide_dataframe()
+            elif layout == "sparse":
+                dataframe = self.to_dataframe().astype(
+                                        pd.SparseDtype(np.float64, np.nan))
+            elif layout == "long":
+                dataframe = self._long_dataframe()
+            else:
+                raise ValueError("Unknown layout: {0}".format(layout))
+            self._dataframes[layout] = dataframe
+        return self._dataframes[layout]
+    
+    def _wide_dataframe(self):
+        headers = self.column_headers
+        columns = dict((header, index) for index, header in \
+                                                        enumerate(headers))
+        records = self.records()
+        values = np.full((len(records), len(headers)), np.nan)
+        for row, record in enumerate(records.values()):
+            # keys without a header are left out, as the row-by-row
+            # assignment aligned each record on the headers
+            present = [(columns[header], value) for header, value in \
+                                        record.items() if header in columns]
+            if present:
+                indexes, row_values = zip(*present)
+                values[row, list(indexes)] = np.array(row_values, dtype=float)
+        return pd.DataFrame(values, index=list(records), columns=headers)
+    
+    def _long_dataframe(self):
+        headers = set(self.column_headers)
+        languages = []
+        variables = []
+        values = []
+        for language, record in self.records().items():
+            for header, value in record.items():
+                if header in headers and value is not None:
+                    languages.append(language)
+                    variables.append(header)
+                    values.append(value)
+        return pd.DataFrame({"language": languages,
+                             "variable": variables,
+                             "value": np.array(values, dtype=float)},
+                            columns=["language", "variable", "value"])
\ No newline at end of file
@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+
+# Parallel verses of several languages, streamed from the XML files.
+# Run from this folder:
+#     python bitext.py out_folder file1.xml file2.xml [...] [options]
+
+import argparse
+from collections import OrderedDict
+from itertools import combinations
+import os
+
+from alignment import AlignmentIndex
+from bible import Bible
+from reader import BibleReader
+from tokenizer import get_tokenizer, tokenizer_for
+
+
+def book_stream(file_path, tokenize=False):
+    # (book id, verse id -> text) of a file one book at a time; the texts
+    # are joined back with spaces after tokenizing when tokenize is set
+    reader = BibleReader(file_path)
+    for book_id, chapters in reader.book_records():
+        verse_records = [verse_record for _, verse_records in chapters \
+                                        for verse_record in verse_records]
+        texts = [text for _, text in verse_records]
+        if tokenize:
+            tokenizer = get_tokenizer(tokenizer_for(reader.metadata))
+            texts = [" ".join(tokens) for tokens in \
+                                            tokenizer.tokenize_batch(texts)]
+        verses = OrderedDict()
+        for (verse_id, _), text in zip(verse_records, texts):
+            # repeated ids keep their first occurrence, as in AlignmentIndex
+            if verse_id not in verses:
+                verses[verse_id] = text
+        yield book_id, verses
+
+
+class CanonicalBooks(object):
+    # Hands out the books of a stream in Bible.all_books order, looking at
+    # most one book ahead. The files list their books in that order, so a
+    # book found after the requested one means the requested one is
+    # missing; books out of that order are skipped.
+
+    _book_order = dict((book_id, order) for order, book_id in \
+                                                enumerate(Bible.all_books))
+
+    def __init__(self, books):
+        self._books = iter(books)
+        self._ahead = None
+
+    def get(self, book_id):
+        order = CanonicalBooks._book_order[book_id]
+        while True:
+            if self._ahead is None:
+                self._ahead = next(self._books, None)
+                if self._ahead is None:
+                    return None
+            ahead_order = CanonicalBooks._book_order.get(self._ahead[0], -1)
+            if ahead_order > order:
+                return None
+            verses = self._ahead[1]
+            self._ahead = None
+            if ahead_order == order:
+                return verses
+
+
+def aligned_verses(file_paths, tokenize=False, complete=True):
+    # (verse id, (text of each file)) in canonical order, holding one book
+    # per file at a time. With complete only the verses that every file
+    # has, with a text, are given; else missing verses are None and merged
+    # ones "".
+    streams = [CanonicalBooks(book_stream(file_path, tokenize)) for \
+                                                    file_path in file_paths]
+    for book_id in Bible.all_books:
+        books = [stream.get(book_id) for stream in streams]
+        if complete and None in books:
+            continue
+        books = [verses if verses is not None else {} for verses in books]
+        verse_ids = sorted(set().union(*books), key=AlignmentIndex.verse_key)
+        for verse_id in verse_ids:
+            texts = tuple(verses.get(verse_id) for verses in books)
+            if complete and not all(texts):
+                continue
+            yield verse_id, texts
+
+
+def aligned_pairs(file_paths, pairs=None, tokenize=False, tuples=False):
+    # (pair, verse id, (text a, text b)) for every pair of files (indexes
+    # into file_paths, all of them by default) that both have the verse,
+    # and with tuples ('all', verse id, (text of each file)) for the verses
+    # all files have, from one pass over the files
+    if pairs is None:
+        pairs = list(combinations(range(len(file_paths)), 2))
+    for verse_id, texts in aligned_verses(file_paths, tokenize, False):
+        for pair in pairs:
+            first, second = texts[pair[0]], texts[pair[1]]
+            if first and second:
+                yield pair, verse_id, (first, second)
+        if tuples and all(texts):
+            yield 'all', verse_id, texts
+
+
+def language_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def clean(text):
+    return " ".join(text.split())
+
+
+def write_line(out_file, verse_id, texts):
+    out_file.write(verse_id + "\t" + \
+                   "\t".join(clean(text or "") for text in texts) + "\n")
+
+
+def extract(out_folder, file_paths, pairs=None, tuples=False,
+            tokenize=False):
+    # Writes one tab separated file per pair (verse id, text a, text b),
+    # and with tuples one more with the verses all files have, in a single
+    # pass over the sources. Returns the number of lines of each file.
+    if not os.path.isdir(out_folder):
+        os.makedirs(out_folder)
+    names = [language_name(file_path) for file_path in file_paths]
+    if pairs is None:
+        pairs = list(combinations(range(len(file_paths)), 2))
+
+    out_files = OrderedDict()
+    for pair in pairs:
+        out_files[pair] = open(os.path.join(out_folder, "{0}-{1}.tsv".format(
+                                                            names[pair[0]],
+                                                            names[pair[1]])),
+                               "w", encoding="utf-8")
+    if tuples:
+        out_files['all'] = open(os.path.join(out_folder, "all.tsv"),
+                                "w", encoding="utf-8")
+        write_line(out_files['all'], "id", names)
+    lines = OrderedDict((key, 0) for key in out_files)
+
+    try:
+        for key, verse_id, texts in aligned_pairs(file_paths, pairs, tokenize,
+                                                  tuples):
+            write_line(out_files[key], verse_id, texts)
+            lines[key] += 1
+    finally:
+        for out_file in out_files.values():
+            out_file.close()
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        description="Parallel verses of bible files")
+    parser.add_argument("out_folder")
+    parser.add_argument("file_paths", nargs="+")
+    parser.add_argument("--pivot", action="store_true",
+                        help="only pair the first file with each other one")
+    parser.add_argument("--tuples", action="store_true",
+                        help="also write the verses all the files have")
+    parser.add_argument("--tokenize", action="store_true",
+                        help="tokenize the texts with the project tokenizer")
+    args = parser.parse_args()
+
+    pairs = None
+    if args.pivot:
+        pairs = [(0, index) for index in range(1, len(args.file_paths))]
+    lines = extract(args.out_folder, args.file_paths, pairs, args.tuples,
+                    args.tokenize)
+    names = [language_name(file_path) for file_path in args.file_paths]
+    for key, count in lines.items():
+        name = "all" if key == 'all' else "-".join(names[index] for \
+                                                            index in key)
+        print("{0}: {1} verses".format(name, count))
@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import os
+import pickle
+import struct
+
+from columnar import ColumnStore
+from reader import BibleReader
+
+
+class BibleCache(object):
+    # On-disk cache of parsed bible files. Every entry stores the header
+    # metadata and the ColumnStore of one XML file together with the
+    # fingerprint (size, mtime and sha1 of the contents) of the file it was
+    # built from, and is only used while that fingerprint still matches.
+    # The cache folder is the one next to this folder, whatever the working
+    # directory.
+
+    cache_folder = os.path.join(os.path.dirname(os.path.dirname(
+                                            os.path.abspath(__file__))),
+                                "cache")
+    version = 2
+
+    _magic = b"BIBC"
+    _header = struct.Struct("<4sHQq20s")
+
+    @classmethod
+    def cache_path(cls, file_path):
+        key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8"))
+        return os.path.join(cls.cache_folder, key.hexdigest() + ".bin")
+
+    @classmethod
+    def fingerprint(cls, file_path):
+        stat = os.stat(file_path)
+        content_hash = hashlib.sha1()
+        with open(file_path, "rb") as source:
+            for block in iter(lambda: source.read(1 << 20), b""):
+                content_hash.update(block)
+        return stat.st_size, stat.st_mtime_ns, content_hash.digest()
+
+    @classmethod
+    def _read(cls, file_path):
+        cache_path = cls.cache_path(file_path)
+        if not os.path.exists(cache_path):
+            return None
+
+        stat = os.stat(file_path)
+        with open(cache_path, "rb") as cache_file:
+            header = cache_file.read(cls._header.size)
+            if len(header) != cls._header.size:
+                return None
+            magic, version, size, mtime, content_hash = \
+                                                    cls._header.unpack(header)
+            if magic != cls._magic or version != cls.version or \
+               size != stat.st_size or mtime != stat.st_mtime_ns:
+                return None
+            if content_hash != cls.fingerprint(file_path)[2]:
+                return None
+            try:
+                return pickle.load(cache_file)
+            except Exception:
+                return None
+
+    @classmethod
+    def is_valid(cls, file_path):
+        return cls._read(file_path) is not None
+
+    @classmethod
+    def load(cls, file_path):
+        # (metadata, column store), rebuilding the entry when it is stale
+        entry = cls._read(file_path)
+        if entry is None:
+            entry = cls.rebuild(file_path)
+        return entry
+
+    @classmethod
+    def rebuild(cls, file_path):
+        fingerprint = cls.fingerprint(file_path)
+        reader = BibleReader(file_path)
+        store = ColumnStore.from_records(reader.book_records())
+        entry = (reader.metadata, store)
+
+        if not os.path.isdir(cls.cache_folder):
+            os.makedirs(cls.cache_folder)
+        cache_path = cls.cache_path(file_path)
+        temp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+        with open(temp_path, "wb") as cache_file:
+            cache_file.write(cls._header.pack(cls._magic,
+                                              cls.version,
+                                              *fingerprint))
+            pickle.dump(entry, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+        return entry
+
+    @classmethod
+    def invalidate(cls, file_path):
+        cache_path = cls.cache_path(file_path)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    @classmethod
+    def clear(cls):
+        if not os.path.isdir(cls.cache_folder):
+            return
+        for filename in os.listdir(cls.cache_folder):
+            if filename.endswith(".bin"):
+                os.remove(os.path.join(cls.cache_folder, filename))
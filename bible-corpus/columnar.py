@@ -0,0 +1,193 @@
+# -*- coding:utf-8 -*-
+
+from array import array
+
+from counting import TextCounts
+from tokenizer import get_tokenizer
+from vocabulary import Vocabulary
+
+
+class StringTable(object):
+    # A sequence of strings stored back to back as UTF-8 in one buffer,
+    # the i-th string being buffer[offsets[i]:offsets[i + 1]]. The buffer
+    # can be bytes or any object supporting the buffer protocol (an mmap).
+
+    __slots__ = ("buffer", "offsets")
+
+    def __init__(self, buffer=b"", offsets=None):
+        self.buffer = buffer
+        self.offsets = array('Q', [0]) if offsets is None else offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = array('Q', [0])
+        total = 0
+        for string in encoded:
+            total += len(string)
+            offsets.append(total)
+        return StringTable(b"".join(encoded), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return str(self.buffer[self.offsets[index]:self.offsets[index + 1]],
+                   "utf-8")
+
+    def __iter__(self):
+        return iter(self.slice(0, len(self)))
+
+    def slice(self, first, end):
+        # The strings first..end-1 as a list
+        buffer = self.buffer
+        offsets = self.offsets[first:end + 1]
+        return [str(buffer[start:stop], "utf-8") for start, stop in \
+                                                zip(offsets, offsets[1:])]
+
+    def __getstate__(self):
+        return bytes(self.buffer), array('Q', self.offsets)
+
+    def __setstate__(self, state):
+        self.buffer, self.offsets = state
+
+
+class ColumnStore(object):
+    # The book / chapter / verse hierarchy of one bible as parallel arrays.
+    # Verses, chapters and books are numbered in document order:
+    #   texts, verse_ids         one string per verse
+    #   verse_chapter            chapter index of each verse
+    #   chapter_ids              one string per chapter
+    #   chapter_book             book index of each chapter
+    #   chapter_verses           first verse of each chapter, plus the end
+    #   book_ids                 one string per book
+    #   book_chapters            first chapter of each book, plus the end
+    #
+    # The tokenizer, the vocabulary and the per-book token ids and counts
+    # are not part of the columns; they are set up when the store is used.
+
+    columns = ("texts", "verse_ids", "verse_chapter",
+               "chapter_ids", "chapter_book", "chapter_verses",
+               "book_ids", "book_chapters")
+
+    def __init__(self, texts, verse_ids, verse_chapter,
+                 chapter_ids, chapter_book, chapter_verses,
+                 book_ids, book_chapters, tokenizer=None, vocabulary=None):
+        self.texts = texts
+        self.verse_ids = verse_ids
+        self.verse_chapter = verse_chapter
+        self.chapter_ids = chapter_ids
+        self.chapter_book = chapter_book
+        self.chapter_verses = chapter_verses
+        self.book_ids = book_ids
+        self.book_chapters = book_chapters
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.vocabulary = vocabulary or Vocabulary()
+        self._encoded = {}
+        self._counts = {}
+
+    @classmethod
+    def from_records(cls, book_records, tokenizer=None, vocabulary=None):
+        # book_records as yielded by BibleReader.book_records
+        texts = []
+        verse_ids = []
+        verse_chapter = array('I')
+        chapter_ids = []
+        chapter_book = array('I')
+        chapter_verses = array('I', [0])
+        book_ids = []
+        book_chapters = array('I', [0])
+        for book_id, chapter_records in book_records:
+            for chapter_id, verse_records in chapter_records:
+                for verse_id, text in verse_records:
+                    texts.append(text)
+                    verse_ids.append(verse_id)
+                    verse_chapter.append(len(chapter_ids))
+                chapter_book.append(len(book_ids))
+                chapter_ids.append(chapter_id)
+                chapter_verses.append(len(texts))
+            book_ids.append(book_id)
+            book_chapters.append(len(chapter_ids))
+        return ColumnStore(StringTable.from_strings(texts),
+                           StringTable.from_strings(verse_ids),
+                           verse_chapter,
+                           StringTable.from_strings(chapter_ids),
+                           chapter_book,
+                           chapter_verses,
+                           StringTable.from_strings(book_ids),
+                           book_chapters,
+                           tokenizer,
+                           vocabulary)
+
+    def __getstate__(self):
+        # columns mapped from a CorpusStore are pickled as copies
+        state = {}
+        for name in self.columns:
+            column = getattr(self, name)
+            if isinstance(column, memoryview):
+                column = array(column.format, column)
+            state[name] = column
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def verse_count(self):
+        return len(self.verse_chapter)
+
+    def chapter_count(self):
+        return len(self.chapter_book)
+
+    def book_count(self):
+        return len(self.book_ids)
+
+    def book_verses(self, book_index):
+        # (first, end) verse indexes of a book
+        return self.chapter_verses[self.book_chapters[book_index]], \
+               self.chapter_verses[self.book_chapters[book_index + 1]]
+
+    def verse_book(self, verse_index):
+        return self.chapter_book[self.verse_chapter[verse_index]]
+
+    def verse_texts(self, first, end):
+        return self.texts.slice(first, end)
+
+    def encode(self, book_index):
+        # The token ids of every verse of a book, one after the other, and
+        # the offsets delimiting each verse. The whole book is tokenized in
+        # one batch and interned.
+        encoded = self._encoded.get(book_index)
+        if encoded is None:
+            token_ids = array('I')
+            verse_offsets = array('I', [0])
+            encode = self.vocabulary.encode
+            for tokens in self.tokenizer.tokenize_batch(
+                            self.verse_texts(*self.book_verses(book_index))):
+                token_ids.extend(encode(tokens))
+                verse_offsets.append(len(token_ids))
+            encoded = self._encoded[book_index] = (token_ids, verse_offsets)
+        return encoded
+
+    def counts(self, book_index, first, end):
+        # Counts of the verses first..end-1 of a book; those of whole books
+        # are cached
+        if (first, end) != self.book_verses(book_index):
+            return self._count(book_index, first, end)
+        counts = self._counts.get(book_index)
+        if counts is None:
+            counts = self._counts[book_index] = self._count(book_index,
+                                                            first,
+                                                            end)
+        return counts
+
+    def _count(self, book_index, first, end):
+        token_ids, verse_offsets = self.encode(book_index)
+        book_first = self.book_verses(book_index)[0]
+        start, stop = first - book_first, end - book_first
+        return TextCounts.from_ids(self.vocabulary,
+                                   self.verse_texts(first, end),
+                                   token_ids[verse_offsets[start]:
+                                             verse_offsets[stop]],
+                                   verse_offsets[start:stop + 1])
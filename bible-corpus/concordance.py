@@ -0,0 +1,300 @@
+# -*- coding:utf-8 -*-
+
+# Inverted index of the tokens of several bibles and keyword in context
+# search on it. Run from this folder:
+#     python concordance.py word [file.xml ...]
+
+from collections import OrderedDict
+import os
+import pickle
+import struct
+import sys
+
+import numpy as np
+
+from alignment import AlignmentIndex
+from bible import Bible
+from tokenizer import get_tokenizer
+
+
+class Concordance(object):
+    # For every language (named by file path) the sorted verse positions
+    # (in its ColumnStore) where each token of its vocabulary appears,
+    # stored as one array of positions and the offsets of the postings of
+    # each token id, together with the AlignmentIndex of the files. It is
+    # built once, saved to index_file and only rebuilt when the sources
+    # change; the bibles themselves are only opened to show the hits.
+
+    index_file = "../cache/concordance.bin"
+    version = 1
+
+    _magic = b"BIBX"
+    _header = struct.Struct("<4sH")
+
+    def __init__(self, sources, fingerprints, tokenizers, tokens, postings,
+                 alignment, corpus=None):
+        self.sources = sources
+        self.fingerprints = fingerprints
+        self.tokenizers = tokenizers
+        self.tokens = tokens
+        self.postings = postings
+        self.alignment = alignment
+        self.corpus = corpus
+        self._token_ids = {}
+        self._bibles = {}
+
+    @classmethod
+    def fingerprint(cls, file_path):
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def verse_postings(cls, store):
+        # (token types, offsets, positions) of one language: the verses of
+        # token id i are positions[offsets[i]:offsets[i + 1]]
+        token_ids = []
+        verses = []
+        for book_index in range(store.book_count()):
+            book_token_ids, verse_offsets = store.encode(book_index)
+            first = store.book_verses(book_index)[0]
+            lengths = np.diff(np.array(verse_offsets, dtype=np.int64))
+            token_ids.append(np.array(book_token_ids, dtype=np.int64))
+            verses.append(np.repeat(np.arange(first, first + len(lengths)),
+                                    lengths))
+        vocabulary_size = len(store.vocabulary)
+        verse_count = store.verse_count()
+        if token_ids:
+            keys = np.unique(np.concatenate(token_ids) * verse_count + \
+                                                    np.concatenate(verses))
+        else:
+            keys = np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(vocabulary_size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // verse_count if verse_count else keys,
+                              minlength=vocabulary_size),
+                  out=offsets[1:])
+        positions = (keys % verse_count if verse_count else keys
+                     ).astype(np.int32)
+        return list(store.vocabulary.tokens), offsets, positions
+
+    @classmethod
+    def build(cls, file_paths, corpus=None):
+        bibles = OrderedDict((file_path, Bible.from_source(file_path,
+                                                           corpus)) \
+                                                for file_path in file_paths)
+        tokenizers = OrderedDict()
+        tokens = OrderedDict()
+        postings = OrderedDict()
+        for file_path, bible in bibles.items():
+            tokenizers[file_path] = bible.metadata['tokenizer']
+            store = bible.column_store()
+            tokens[file_path], offsets, positions = \
+                                        Concordance.verse_postings(store)
+            postings[file_path] = (offsets, positions)
+        alignment = AlignmentIndex.from_bibles(bibles)
+        concordance = Concordance(list(bibles),
+                                  [Concordance.fingerprint(file_path) for \
+                                                    file_path in bibles],
+                                  tokenizers,
+                                  tokens,
+                                  postings,
+                                  alignment,
+                                  corpus)
+        concordance._bibles.update(bibles)
+        return concordance
+
+    def is_stale(self):
+        for file_path, fingerprint in zip(self.sources, self.fingerprints):
+            try:
+                if Concordance.fingerprint(file_path) != tuple(fingerprint):
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def save(self, index_file=None):
+        index_file = index_file or Concordance.index_file
+        folder = os.path.dirname(index_file)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        # the stores of the alignment are opened again when loading
+        state = (self.sources, self.fingerprints, self.tokenizers,
+                 self.tokens, self.postings,
+                 (self.alignment.languages, self.alignment.verse_ids,
+                  self.alignment.positions, self.alignment.merged,
+                  self.alignment.duplicates))
+        temp_path = "{0}.{1}.tmp".format(index_file, os.getpid())
+        with open(temp_path, "wb") as out_file:
+            out_file.write(Concordance._header.pack(Concordance._magic,
+                                                    Concordance.version))
+            pickle.dump(state, out_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, index_file)
+
+    @classmethod
+    def load(cls, index_file=None, corpus=None):
+        # None when there is no usable index
+        index_file = index_file or Concordance.index_file
+        if not os.path.exists(index_file):
+            return None
+        with open(index_file, "rb") as in_file:
+            header = in_file.read(Concordance._header.size)
+            if len(header) != Concordance._header.size or \
+               Concordance._header.unpack(header) != (Concordance._magic,
+                                                      Concordance.version):
+                return None
+            try:
+                sources, fingerprints, tokenizers, tokens, postings, \
+                                            alignment = pickle.load(in_file)
+            except Exception:
+                return None
+        languages, verse_ids, positions, merged, duplicates = alignment
+        concordance = Concordance(sources, fingerprints, tokenizers, tokens,
+                                  postings, None, corpus)
+        concordance.alignment = AlignmentIndex(languages,
+                                               _LazyStores(concordance),
+                                               verse_ids, positions, merged,
+                                               duplicates)
+        return concordance
+
+    @classmethod
+    def open(cls, file_paths, index_file=None, corpus=None):
+        # The saved index when it covers the same up to date files, else a
+        # new one, which is saved
+        concordance = Concordance.load(index_file, corpus)
+        if concordance is None or concordance.is_stale() or \
+           concordance.sources != list(file_paths):
+            concordance = Concordance.build(file_paths, corpus)
+            concordance.save(index_file)
+        return concordance
+
+    def bible(self, language):
+        bible = self._bibles.get(language)
+        if bible is None:
+            bible = self._bibles[language] = Bible.from_source(language,
+                                                               self.corpus)
+        return bible
+
+    def store(self, language):
+        return self.bible(language).column_store()
+
+    def token_id(self, language, token):
+        token_ids = self._token_ids.get(language)
+        if token_ids is None:
+            token_ids = self._token_ids[language] = dict(
+                                    (token, token_id) for token_id, token in \
+                                            enumerate(self.tokens[language]))
+        return token_ids.get(token)
+
+    def tokenize(self, query, language):
+        # The query tokenized as the texts of the language
+        return get_tokenizer(self.tokenizers[language]).tokenize(query)
+
+    def lookup(self, token, language):
+        # Verse positions of a token in a language, as an int32 array
+        offsets, positions = self.postings[language]
+        token_id = self.token_id(language, token)
+        if token_id is None:
+            return positions[:0]
+        return positions[offsets[token_id]:offsets[token_id + 1]]
+
+    def verses_with(self, tokens, language):
+        # Positions of the verses holding all the tokens
+        result = None
+        for token in tokens:
+            positions = self.lookup(token, language)
+            result = positions if result is None else \
+                     np.intersect1d(result, positions, assume_unique=True)
+        return result if result is not None else np.zeros(0, np.int32)
+
+    def counts(self, query):
+        # language -> number of verses holding all the tokens of the query
+        return OrderedDict((language,
+                            len(self.verses_with(self.tokenize(query,
+                                                               language),
+                                                 language))) for \
+                                                    language in self.sources)
+
+    def search(self, query, languages=None, width=5, parallels=None,
+               limit=None):
+        # Keyword in context lines for the verses holding all the tokens of
+        # query, one per occurrence of its first token:
+        #   language, verse_id, left, keyword, right
+        # and, with parallels (a list of languages, or True for all of
+        # them), the aligned verse in each of those languages.
+        if parallels is True:
+            parallels = self.sources
+
+        hits = []
+        for language in languages or self.sources:
+            tokens = self.tokenize(query, language)
+            if not tokens:
+                continue
+            positions = self.verses_with(tokens, language)
+            if not len(positions):
+                continue
+            store = self.store(language)
+            for position in positions.tolist():
+                verse_id = store.verse_ids[position]
+                verse_tokens = store.tokenizer.tokenize(
+                                                    store.texts[position])
+                for index, token in enumerate(verse_tokens):
+                    if token != tokens[0]:
+                        continue
+                    hit = OrderedDict([
+                            ('language', language),
+                            ('verse_id', verse_id),
+                            ('left', " ".join(verse_tokens[max(0,
+                                                        index - width):
+                                                           index])),
+                            ('keyword', token),
+                            ('right', " ".join(verse_tokens[index + 1:
+                                                       index + 1 + width]))])
+                    if parallels:
+                        hit['parallels'] = self.parallels(verse_id,
+                                                          parallels)
+                    hits.append(hit)
+                    if limit is not None and len(hits) >= limit:
+                        return hits
+        return hits
+
+    def parallels(self, verse_id, languages):
+        # language -> text of the verse (None when missing)
+        texts = OrderedDict()
+        if verse_id not in self.alignment:
+            return texts
+        row_positions = self.alignment.aligned_positions(verse_id).tolist()
+        for language in languages:
+            position = row_positions[self.alignment.languages.index(
+                                                                language)]
+            texts[language] = None if position == AlignmentIndex.missing \
+                                   else self.store(language).texts[position]
+        return texts
+
+
+class _LazyStores(object):
+    # language -> ColumnStore mapping of a loaded Concordance, opening the
+    # bibles on first use
+
+    def __init__(self, concordance):
+        self.concordance = concordance
+
+    def __getitem__(self, language):
+        return self.concordance.store(language)
+
+
+if __name__ == "__main__":
+    import time
+
+    file_paths = sys.argv[2:] or [os.path.join("../bibles/Usable/", name) \
+                        for name in sorted(os.listdir("../bibles/Usable/"))]
+    concordance = Concordance.open(file_paths)
+    start = time.time()
+    hits = concordance.search(sys.argv[1], parallels=True, limit=20)
+    elapsed = time.time() - start
+    for hit in hits:
+        print("{0:<30} {1:<14} {2:>40} [{3}] {4}".format(
+                                        os.path.basename(hit['language']),
+                                        hit['verse_id'],
+                                        hit['left'],
+                                        hit['keyword'],
+                                        hit['right']))
+    print("{0} hits in {1:.1f} ms".format(len(hits), elapsed * 1000))
@@ -0,0 +1,186 @@
+# -*- coding:utf-8 -*-
+
+# Build step of the shared corpus file. Run from this folder:
+#     python corpus.py [bibles folder] [corpus file]
+
+import json
+import mmap
+import os
+import struct
+import sys
+
+from columnar import ColumnStore, StringTable
+from reader import BibleReader
+
+
+class CorpusStore(object):
+    # Every bible of a folder tree in one file that is opened with mmap.
+    # The file holds, for each source file, the columns of its ColumnStore
+    # as raw native arrays, and a JSON directory with the header metadata
+    # and the position of every column. Stores opened from it are views
+    # over the mapping, so processes opening the same file share its pages
+    # instead of each parsing and holding its own copy.
+    #
+    # Layout: header (magic, version, directory offset and length), then
+    # the 8-byte aligned column sections, then the directory. The directory
+    # holds the bibles folder relative to the folder of the file, so the
+    # file opens from any working directory.
+
+    corpus_file = "../cache/corpus.bin"
+    bible_folder = "../bibles/"
+    version = 2
+
+    _magic = b"BIBS"
+    _header = struct.Struct("<4sHxxQQ")
+
+    # processes open each corpus file once
+    _shared = {}
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, "rb") as corpus_file:
+            self._map = mmap.mmap(corpus_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+        magic, version, offset, length = \
+                        CorpusStore._header.unpack_from(self._view, 0)
+        if magic != CorpusStore._magic:
+            raise ValueError("Not a corpus file: {0}".format(file_path))
+        if version != CorpusStore.version:
+            raise ValueError("Corpus file of version {0}, build it again:"
+                             " {1}".format(version, file_path))
+        self.directory = json.loads(str(self._view[offset:offset + length],
+                                        "utf-8"))
+        if self.directory['byteorder'] != sys.byteorder:
+            raise ValueError("Corpus file built with another byte order")
+        self.root = os.path.normpath(os.path.join(
+                                    os.path.dirname(os.path.abspath(file_path)),
+                                    self.directory['root']))
+        self.entries = self.directory['entries']
+
+    @classmethod
+    def open(cls, file_path=None):
+        file_path = os.path.abspath(file_path or cls.corpus_file)
+        corpus = cls._shared.get(file_path)
+        if corpus is None:
+            corpus = cls._shared[file_path] = CorpusStore(file_path)
+        return corpus
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def names(self):
+        return sorted(self.entries)
+
+    def name_for(self, file_path):
+        # Entry name of a source file path, None if it is not in the corpus
+        name = os.path.relpath(os.path.abspath(file_path), self.root)
+        name = name.replace(os.sep, "/")
+        return name if name in self.entries else None
+
+    def source_path(self, name):
+        return os.path.join(self.root, name)
+
+    def metadata(self, name):
+        return dict(self.entries[name]['metadata'])
+
+    def is_stale(self, name):
+        entry = self.entries[name]
+        try:
+            stat = os.stat(self.source_path(name))
+        except OSError:
+            return True
+        return stat.st_size != entry['size'] or \
+               stat.st_mtime_ns != entry['mtime_ns']
+
+    def _column(self, section):
+        offset, length, typecode = section
+        column = self._view[offset:offset + length]
+        return column if typecode == "B" else column.cast(typecode)
+
+    def store(self, name, tokenizer=None, vocabulary=None):
+        # A ColumnStore whose columns are views over the mapped file
+        columns = {}
+        for column, sections in self.entries[name]['columns'].items():
+            if len(sections) == 2:
+                columns[column] = StringTable(self._column(sections[0]),
+                                              self._column(sections[1]))
+            else:
+                columns[column] = self._column(sections[0])
+        return ColumnStore(tokenizer=tokenizer, vocabulary=vocabulary,
+                           **columns)
+
+    @classmethod
+    def source_files(cls, bible_folder):
+        for folder, _, filenames in sorted(os.walk(bible_folder)):
+            for filename in sorted(filenames):
+                if filename.endswith(".xml"):
+                    yield os.path.join(folder, filename)
+
+    @classmethod
+    def build(cls, bible_folder=None, file_path=None):
+        bible_folder = bible_folder or cls.bible_folder
+        file_path = file_path or cls.corpus_file
+        folder = os.path.dirname(file_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        entries = {}
+        temp_path = "{0}.{1}.tmp".format(file_path, os.getpid())
+        with open(temp_path, "wb") as corpus_file:
+            corpus_file.write(b"\0" * cls._header.size)
+
+            def write_section(data, typecode):
+                data = memoryview(data).cast("B")
+                corpus_file.write(b"\0" * (-corpus_file.tell() % 8))
+                offset = corpus_file.tell()
+                corpus_file.write(data)
+                return [offset, len(data), typecode]
+
+            for source in cls.source_files(bible_folder):
+                reader = BibleReader(source)
+                store = ColumnStore.from_records(reader.book_records())
+                columns = {}
+                for column in ColumnStore.columns:
+                    value = getattr(store, column)
+                    if isinstance(value, StringTable):
+                        columns[column] = [
+                                    write_section(value.buffer, "B"),
+                                    write_section(value.offsets,
+                                                  value.offsets.typecode)]
+                    else:
+                        columns[column] = [write_section(value,
+                                                         value.typecode)]
+                stat = os.stat(source)
+                name = os.path.relpath(source, bible_folder)
+                entries[name.replace(os.sep, "/")] = {
+                                            'metadata': reader.metadata,
+                                            'size': stat.st_size,
+                                            'mtime_ns': stat.st_mtime_ns,
+                                            'columns': columns}
+
+            root = os.path.relpath(os.path.abspath(bible_folder),
+                                   os.path.dirname(os.path.abspath(file_path)))
+            directory = json.dumps({'root': root,
+                                    'byteorder': sys.byteorder,
+                                    'entries': entries}).encode("utf-8")
+            offset = corpus_file.tell()
+            corpus_file.write(directory)
+            corpus_file.seek(0)
+            corpus_file.write(cls._header.pack(cls._magic, cls.version,
+                                               offset, len(directory)))
+        os.replace(temp_path, file_path)
+        return len(entries)
+
+
+if __name__ == "__main__":
+    bible_folder = sys.argv[1] if len(sys.argv) > 1 else None
+    file_path = sys.argv[2] if len(sys.argv) > 2 else None
+    count = CorpusStore.build(bible_folder, file_path)
+    print("{0} bibles written to {1}".format(
+                                    count,
+                                    file_path or CorpusStore.corpus_file))
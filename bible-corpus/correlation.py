@@ -0,0 +1,103 @@
+# -*- coding:utf-8 -*-
+
+import numpy as np
+
+from lazy import LazyModule
+
+ss = LazyModule("scipy.stats")
+
+
+def concatenate(series):
+    # Sequences of different lengths as one flat float array and the
+    # index of the sequence of each value
+    series = [np.asarray(values, dtype=np.float64) for values in series]
+    lengths = [len(values) for values in series]
+    if not series:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    return np.concatenate(series), np.repeat(np.arange(len(series)), lengths)
+
+
+def average_ranks(values, segments):
+    # Ranks (from 1) of the values within their segment, ties getting the
+    # average of their ranks as in scipy.stats.rankdata. segments must be
+    # sorted. Each segment is sorted on its own, which is faster than one
+    # sort on (segment, value) keys; the rest works on all of them at once.
+    segment_sizes = np.bincount(segments)
+    segment_ends = np.cumsum(segment_sizes)
+    segment_firsts = segment_ends - segment_sizes
+    order = np.concatenate([first + np.argsort(values[first:end]) for \
+                                first, end in zip(segment_firsts.tolist(),
+                                                  segment_ends.tolist())])
+    ordered = values[order]
+    ordered_segments = segments[order]
+
+    # every run of equal values of a segment is a group
+    starts = np.ones(len(values), dtype=bool)
+    starts[1:] = (ordered[1:] != ordered[:-1]) | \
+                 (ordered_segments[1:] != ordered_segments[:-1])
+    group = np.cumsum(starts) - 1
+    sizes = np.bincount(group)
+
+    # position of every value within its segment
+    positions = np.arange(len(values)) - segment_firsts[ordered_segments]
+    group_ranks = positions[starts] + (sizes + 1) / 2
+
+    ranks = np.empty(len(values))
+    ranks[order] = group_ranks[group]
+    return ranks
+
+
+def spearman_batch(xs, ys):
+    # Spearman's rho and its two-sided p-value for every pair of series
+    # xs[i], ys[i] at once, leaving out the positions where either value is
+    # NaN. Same results as scipy.stats.spearmanr on each pair; NaN where a
+    # series is constant or too short.
+    x, segments = concatenate(xs)
+    y, _ = concatenate(ys)
+    kept = ~(np.isnan(x) | np.isnan(y))
+    x, y, segments = x[kept], y[kept], segments[kept]
+    count = len(xs)
+
+    n = np.bincount(segments, minlength=count)
+    rho = np.full(count, np.nan)
+    p = np.full(count, np.nan)
+    if not len(x):
+        return rho, p
+
+    # ranks of the kept values run from 1 to n, so their mean is known
+    mean = (n[segments] + 1) / 2
+    x_dev = average_ranks(x, segments) - mean
+    y_dev = average_ranks(y, segments) - mean
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rho = np.bincount(segments, x_dev * y_dev, count) / \
+              np.sqrt(np.bincount(segments, x_dev ** 2, count) * \
+                      np.bincount(segments, y_dev ** 2, count))
+        rho = np.clip(rho, -1, 1)
+
+        dof = n - 2
+        t = rho * np.sqrt((dof / ((rho + 1) * (1 - rho))).clip(0))
+        p = 2 * ss.t.sf(np.abs(t), dof)
+    rho[n < 2] = np.nan
+    p[np.isnan(rho)] = np.nan
+    return rho, p
+
+
+def steiger_test(n, r12, r13, r23):
+    # Test of the difference between the dependent correlations r12 and r13
+    # (variable 1 shared, r23 the correlation of the other two) on n
+    # observations, as psych::r.test(n, r12, r13, r23) in R: Steiger's
+    # (1980) form of Williams' t with n - 3 degrees of freedom. Arrays are
+    # tested element-wise; returns (t, two-sided p).
+    n = np.asarray(n, dtype=np.float64)
+    r12 = np.asarray(r12, dtype=np.float64)
+    r13 = np.asarray(r13, dtype=np.float64)
+    r23 = np.asarray(r23, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        determinant = 1 - r12 ** 2 - r23 ** 2 - r13 ** 2 + 2 * r12 * r23 * r13
+        average = (r12 + r13) / 2
+        cube = (1 - r23) ** 3
+        t = (r12 - r13) * np.sqrt((n - 1) * (1 + r23) / \
+                                  ((2 * (n - 1) / (n - 3)) * determinant + \
+                                   average ** 2 * cube))
+        p = 2 * ss.t.sf(np.abs(t), n - 3)
+    return t, p
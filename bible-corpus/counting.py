@@ -0,0 +1,190 @@
+# -*- coding:utf-8 -*-
+
+from array import array
+from collections import Counter
+
+import numpy as np
+
+
+class SparseCounts(object):
+    # Counts of non-negative integer keys (token ids, code points) as two
+    # parallel arrays: the distinct keys in increasing order and their
+    # counts
+
+    def __init__(self, keys=None, counts=None):
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else keys
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None \
+                                                                else counts
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_values(cls, values):
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return SparseCounts()
+        keys, counts = np.unique(values, return_counts=True)
+        return SparseCounts(keys, counts.astype(np.int64))
+
+    @classmethod
+    def from_text(cls, text):
+        return SparseCounts.from_values(np.frombuffer(
+                                                text.encode("utf-32-le"),
+                                                dtype="<u4"))
+
+    @classmethod
+    def merge(cls, partials):
+        partials = [partial for partial in partials if len(partial)]
+        if not partials:
+            return SparseCounts()
+        if len(partials) == 1:
+            return partials[0]
+        keys, inverse = np.unique(np.concatenate([partial.keys for \
+                                                  partial in partials]),
+                                  return_inverse=True)
+        counts = np.bincount(inverse,
+                             weights=np.concatenate([partial.counts for \
+                                                     partial in partials]),
+                             minlength=len(keys))
+        return SparseCounts(keys, counts.astype(np.int64))
+
+    def items(self):
+        return zip(self.keys.tolist(), self.counts.tolist())
+
+
+class TextCounts(object):
+    # Everything the hierarchy counts about a stretch of text, as sparse
+    # counts over integers: interned token ids of a Vocabulary (assigned in
+    # order of first appearance) and code points of the characters.
+    #
+    # All the fields are mergeable partials (sparse counts and moment sums
+    # of the verse lengths), so the counts of any set of books are the
+    # merge of the counts of each book.
+
+    digits = set("1234567890")
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+        self.tokens = SparseCounts()
+        self.chars = SparseCounts()
+        self.lower_chars = SparseCounts()
+        self.token_count = 0
+        # moment sums of the number of tokens per verse
+        self.verse_count = 0
+        self.verse_token_squares = 0
+
+    @classmethod
+    def from_ids(cls, vocabulary, texts, token_ids, verse_offsets):
+        # token_ids are the ids of all the texts one after the other and
+        # verse_offsets (one more entry than texts) delimit each text
+        counts = TextCounts(vocabulary)
+        counts.tokens = SparseCounts.from_values(token_ids)
+        verse_lengths = np.diff(np.array(verse_offsets, dtype=np.int64))
+        counts.token_count = int(len(token_ids))
+        counts.verse_count = int(len(verse_lengths))
+        counts.verse_token_squares = int(np.dot(verse_lengths,
+                                                verse_lengths))
+        text = "".join(texts)
+        counts.chars = SparseCounts.from_text(text)
+        counts.lower_chars = SparseCounts.from_text(text.lower())
+        return counts
+
+    @classmethod
+    def from_tokens(cls, vocabulary, texts, token_lists):
+        token_ids = array('I')
+        verse_offsets = array('I', [0])
+        for tokens in token_lists:
+            token_ids.extend(vocabulary.encode(tokens))
+            verse_offsets.append(len(token_ids))
+        return TextCounts.from_ids(vocabulary, texts, token_ids, verse_offsets)
+
+    @classmethod
+    def merge(cls, partials, vocabulary=None):
+        partials = list(partials)
+        if vocabulary is None and partials:
+            vocabulary = partials[0].vocabulary
+        for partial in partials:
+            if partial.vocabulary is not vocabulary:
+                raise ValueError("Can't merge counts of different "
+                                 "vocabularies")
+
+        counts = TextCounts(vocabulary)
+        counts.tokens = SparseCounts.merge(partial.tokens for partial in \
+                                                                    partials)
+        counts.chars = SparseCounts.merge(partial.chars for partial in \
+                                                                    partials)
+        counts.lower_chars = SparseCounts.merge(partial.lower_chars for \
+                                                        partial in partials)
+        for partial in partials:
+            counts.token_count += partial.token_count
+            counts.verse_count += partial.verse_count
+            counts.verse_token_squares += partial.verse_token_squares
+        return counts
+
+    @property
+    def token_frequency(self):
+        tokens = self.vocabulary.tokens
+        return Counter({tokens[token_id]: count for token_id, count in \
+                                                        self.tokens.items()})
+
+    @property
+    def char_frequency(self):
+        return Counter({chr(code): count for code, count in \
+                                                        self.chars.items()})
+
+    @property
+    def lower_char_frequency(self):
+        return Counter({chr(code): count for code, count in \
+                                                self.lower_chars.items()})
+
+    @property
+    def length_histogram(self):
+        lengths = self.vocabulary.length_array()[self.tokens.keys]
+        histogram = np.bincount(lengths, weights=self.tokens.counts)
+        return Counter({length: int(histogram[length]) for length in \
+                                        np.flatnonzero(histogram).tolist()})
+
+    def char_frequencies(self, lower_case):
+        if lower_case:
+            return self.lower_char_frequency
+        return self.char_frequency
+
+    def unique_token_count(self):
+        return len(self.tokens)
+
+    def unique_tokens(self):
+        return set(self.vocabulary.decode(self.tokens.keys.tolist()))
+
+    def unique_chars(self):
+        return set().union(*self.unique_tokens()).difference(
+                                                        TextCounts.digits)
+
+    def mean_verse_tokens(self):
+        return self.token_count / self.verse_count
+
+    def variance_verse_tokens(self):
+        # sample variance, as statistics.variance
+        return (self.verse_token_squares - \
+                    self.token_count ** 2 / self.verse_count) / \
+               (self.verse_count - 1)
+
+
+class CountedText(object):
+    # Counting API shared by Verse, Chapter and Book; subclasses provide
+    # counts() returning their TextCounts
+
+    def unique_tokens(self):
+        return self.counts().unique_tokens()
+
+    def unique_chars(self):
+        return self.counts().unique_chars()
+
+    def token_frequency(self):
+        return dict(self.counts().token_frequency)
+
+    def char_frequency(self, lower_case):
+        return dict(self.counts().char_frequencies(lower_case))
+
+    def token_count(self):
+        return self.counts().token_count
@@ -1,15 +1,15 @@
 # -*- coding:utf8 -*-
 
-from bible import Bible
+import random
 
-try:
-    import xml.etree.cElementTree as ET
-except ImportError:
-    import xml.etree.ElementTree as ET
+import numpy as np
 
-import re
-import random
 from bible import Bible
+from counting import SparseCounts
+from reader import BibleReader
+from sampling import MultisetSampler, WordStream
+from tokenizer import tokenize
+from writer import BibleWriter
 
 class RandomBible(object):
 
@@ -18,27 +18,61 @@ class RandomBible(object):
                         bible, 
                         results_folder,
                         model=None):
+        # The new file is written while the original one is read (writer.py),
+        # after a first pass counting its characters, so neither is ever
+        # held whole in memory. The output is the same, to the byte, as the
+        # one of the parsed tree changed in place and written at once.
         
         # Don't get unique chars
-        unique_chars = bible.unique_chars
+        unique_chars = bible.unique_chars()
         original_path = bible.file_path
         
-        xml_tree = ET.ElementTree(file=original_path)
+        if model=="geomlen":
+            unique_chars.add(" ")
+        
+        # Dictionary of counter chars
+        reader = BibleReader(original_path)
+        char_bag = RandomBible.count_character(unique_chars, reader)
+        
+        new_language = reader.metadata['language'] + " random"
+        if model=="geomlen":
+            new_language += "(geometric length)"
+        else:
+            new_language += "(keeps long_char frequency)"
+        
+        def rename(xml_header):
+            RandomBible.rename_header(xml_header, new_language)
+        
+        if model == "geomlen":
+            # generate with geometrical distribution of length
+            words = WordStream(char_bag)
+            def transform(book):
+                RandomBible.substitute_book(words, book)
+        else:
+            # Scramble characters
+            sampler = MultisetSampler(char_bag)
+            codes = RandomBible.symbol_codes(sampler)
+            def transform(book):
+                RandomBible.scramble_book(sampler, codes, book)
         
-        xml_root = xml_tree.getroot()
-        xml_header, xml_text = xml_root.getchildren()
+        results_path = results_folder + new_language + ".xml"
+        BibleWriter(original_path).write(results_path, rename, transform)
+        if model != "geomlen":
+            char_bag.update(sampler.counts())
         
+        print("Finished: " + new_language)
+        return results_path
+    
+    @classmethod
+    def rename_header(cls, xml_header, new_language):
+        # The language of the header becomes new_language, keeping the
+        # whitespace around it, and its codes get a "_rdm" suffix
         language_info = xml_header.find("profileDesc"
                                         ).find("langUsage"
                                                ).find("language")
                                                
         original_language = language_info.text
         stripped_language = original_language.strip()
-        new_language = stripped_language + " random"
-        if model=="geomlen":
-            new_language += "(geometric length)"
-        else:
-            new_language += "(keeps long_char frequency)"
         language_info.text = original_language.rstrip().replace(
                                                             stripped_language, 
                                                             "") + \
@@ -50,107 +84,120 @@ class RandomBible(object):
         language_info.attrib["iso639"] = language_info.attrib["iso639"] + \
                                                                         "_rdm"
         language_info.attrib["id"] = language_info.attrib["id"] + "_rdm"
-        
-        if model=="geomlen":
-            unique_chars.add(" ")
-        
-        # Dictionary of counter chars
-        char_bag = RandomBible.count_character(unique_chars,
-                                               xml_text)
-
-        if model == "geomlen":
-            # generate with geometrical distribution of length
-            uniform_bag = RandomBible.to_uniform_bag(char_bag)
-            RandomBible.substitute_words(uniform_bag, xml_text)
-        else:
-            # Scramble characters
-            RandomBible.scramble_verses(char_bag, xml_text)
-        
-        print("Finished: " + new_language)
-        
-        results_path = results_folder + new_language + ".xml"
-        xml_tree.write(results_path, encoding="unicode")
-        return results_path
     
     @classmethod
-    def count_character(cls, unique_chars, xml_text):
-        count = {}
-        for book in xml_text.getchildren()[0]:
+    def book_verse_texts(cls, book):
+        # Texts of the verses of a book element
+        for chapter in book:
+            if chapter.attrib.get("type", "") == "chapter" :
+                for verse in chapter:
+                    if verse.attrib.get("type", "") == "verse" :
+                        if verse.text:
+                            yield verse.text
+    
+    @classmethod
+    def verse_texts(cls, xml_text):
+        # Texts of the verses of the text element of a CES file
+        for book in xml_text[0]:
             if book.attrib.get("type", "") == "book" :
-                for chapter in book:
-                    if chapter.attrib.get("type", "") == "chapter" :
-                        for verse in chapter:
-                            if verse.attrib.get("type", "") == "verse" :
-                                if verse.text:
-                                    for character in unique_chars:
-                                        count[character] = count.get(character, 
-                                                                 0) + \
-                                                            verse.text.lower(
-                                                                ).count(
-                                                                    character)
-        return count
+                for text in RandomBible.book_verse_texts(book):
+                    yield text
+    
+    @classmethod
+    def count_character(cls, unique_chars, source):
+        # Occurrences of each of unique_chars in the lower cased verse texts
+        # of source: the text element of a parsed file, a BibleReader of the
+        # file or a loaded Bible. All the characters are counted in one pass
+        # (a histogram of the code points), one book at a time from a
+        # reader; a Bible already has those counts, so its file is not read
+        # again. Its texts are stripped, so the whitespace around them in
+        # the file is not counted.
+        if isinstance(source, Bible):
+            counts = source.char_frequency(True)
+        else:
+            if isinstance(source, BibleReader):
+                books = source.books()
+            else:
+                books = (book for book in source[0] if \
+                                    book.attrib.get("type", "") == "book")
+            lower_chars = SparseCounts.merge([SparseCounts.from_text(
+                        "".join(RandomBible.book_verse_texts(book)).lower()) \
+                                                            for book in books])
+            counts = dict((chr(code), count) for code, count in \
+                                                        lower_chars.items())
+        return dict((character, int(counts.get(character, 0))) for \
+                                                character in unique_chars)
+    
+    @classmethod
+    def symbol_codes(cls, sampler):
+        return np.array([ord(character) for character in sampler.symbols],
+                        dtype=np.uint32)
     
     @classmethod
     def scramble_verses(cls, char_bag, xml_text):
-        uniform_bag = RandomBible.probabilities_to_uniform_bag(
-                                        RandomBible.char_bag_to_probability(
-                                                                    char_bag)
-                                                               )
-        for book in xml_text.getchildren()[0]:
+        # Every character of char_bag in the lower cased verses is replaced
+        # by one drawn without replacement from char_bag, so the new texts
+        # have the same characters as the old ones in random places and
+        # keep the verse lengths. The verses of a book are drawn at once
+        # (sampling.py).
+        sampler = MultisetSampler(char_bag)
+        codes = RandomBible.symbol_codes(sampler)
+        for book in xml_text[0]:
             if book.attrib.get("type", "") == "book" :
-                for chapter in book:
-                    if chapter.attrib.get("type", "") == "chapter" :
-                        for verse in chapter:
-                            new_verse = ""
-                            if verse.attrib.get("type", "") == "verse" :
-                                if verse.text:
-                                    uniform_bag = RandomBible.\
-                                                probabilities_to_uniform_bag(
-                                                    RandomBible.\
-                                                        char_bag_to_probability(
-                                                                        char_bag)
-                                                                             )
-                                    if uniform_bag == []:
-                                        uniform_bag = RandomBible.to_uniform_bag(
-                                                                        char_bag
-                                                                        )
-                                    for character in verse.text.lower():
-                                        if character in char_bag.keys():
-                                            new_character = random.sample(
-                                                            uniform_bag, 
-                                                            1)[0]
-                                            new_verse += new_character
-                                            char_bag[new_character] = \
-                                                        char_bag[new_character] - 1
-    
-                                        else:
-                                            new_verse += character
-                            verse.text = new_verse
-                            
-    @classmethod
-    def substitute_words(cls, uniform_bag, xml_text):
-        for book in xml_text.getchildren()[0]:
+                RandomBible.scramble_book(sampler, codes, book)
+        char_bag.update(sampler.counts())
+    
+    @classmethod
+    def scramble_book(cls, sampler, codes, book):
+        verses = [verse for chapter in book \
+                    if chapter.attrib.get("type", "") == "chapter" \
+                        for verse in chapter]
+        texts = [verse.text.lower() if verse.text and \
+                    verse.attrib.get("type", "") == "verse" else "" \
+                                                for verse in verses]
+        for verse, new_verse in zip(verses,
+                                    RandomBible.scramble_texts(
+                                                texts, sampler, codes)):
+            verse.text = new_verse
+    
+    @classmethod
+    def scramble_texts(cls, texts, sampler, codes):
+        # texts with the characters whose code points are in codes drawn
+        # from sampler, in one draw for all of them
+        text = "".join(texts)
+        text_codes = np.frombuffer(text.encode("utf-32-le"),
+                                   dtype=np.uint32).copy()
+        replaced = np.isin(text_codes, codes)
+        text_codes[replaced] = codes[sampler.draw(int(replaced.sum()))]
+        text = text_codes.tobytes().decode("utf-32-le")
+        new_texts = []
+        start = 0
+        for length in map(len, texts):
+            new_texts.append(text[start:start + length])
+            start += length
+        return new_texts
+    
+    @classmethod
+    def substitute_words(cls, char_bag, xml_text):
+        # Every verse gets as many new words as it had tokens, made of
+        # characters drawn with the frequencies of char_bag, " " included,
+        # so the word lengths are geometric. The characters come from
+        # NumPy in blocks (sampling.WordStream), the stream the old one
+        # character at a time loop over to_uniform_bag(char_bag) drew from.
+        words = WordStream(char_bag)
+        for book in xml_text[0]:
             if book.attrib.get("type", "") == "book":
-                for chapter in book:
-                    if chapter.attrib.get("type", "") == "chapter" :
-                        for verse in chapter:
-                            new_verse = ""
-                            if verse.attrib.get("type", "") == "verse" :
-                                if verse.text:
-                                    qty_words = len(RandomBible.tokenize(verse.text))
-                                    new_words = []
-                                    current_word = ""
-                                    while len(new_words) < qty_words:
-                                        new_character = random.sample(
-                                                                uniform_bag,
-                                                                1)[0]
-                                        if new_character != " ":
-                                            current_word += new_character
-                                        else:
-                                            if len(current_word) > 0:
-                                                new_words.append(current_word)
-                                                current_word = ""
-                                    verse.text = " ".join(new_words)
+                RandomBible.substitute_book(words, book)
+    
+    @classmethod
+    def substitute_book(cls, words, book):
+        for chapter in book:
+            if chapter.attrib.get("type", "") == "chapter" :
+                for verse in chapter:
+                    if verse.attrib.get("type", "") == "verse" :
+                        if verse.text:
+                            qty_words = len(RandomBible.tokenize(verse.text))
+                            verse.text = " ".join(words.take(qty_words))
     
     @classmethod
     def to_uniform_bag(cls, char_bag):
@@ -209,14 +256,4 @@ class RandomBible(object):
     
     @classmethod
     def tokenize(self, verse):
-        temp_text = re.sub(r'[^\w\s]', 
-                           '', 
-                           verse, 
-                           re.UNICODE).replace("\t", 
-                                               "").replace("\n", 
-                                                           "").lower()
-
-        temp = temp_text.split(" ")
-        while '' in temp:
-            temp.remove('')
-        return temp
\ No newline at end of file
+        return tokenize(verse)
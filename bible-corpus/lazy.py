@@ -0,0 +1,36 @@
+# -*- coding:utf-8 -*-
+
+import importlib
+import sys
+
+
+class LazyModule(object):
+    # Stands for a module that is only imported on the first access to one
+    # of its attributes. The core modules (reader, tokenizer, the bible
+    # hierarchy and the counts) only use numpy, so the analysis and plotting
+    # packages (matplotlib, pandas, scipy, Bio) are held through these and
+    # cost nothing to the scripts that never use them.
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = \
+                                    importlib.import_module(self._name)
+        return module
+
+    def is_loaded(self):
+        return self.__dict__['_module'] is not None or \
+               self._name in sys.modules
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __repr__(self):
+        return "<lazy module '{0}'>".format(self._name)
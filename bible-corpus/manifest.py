@@ -0,0 +1,125 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import json
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: save locks with a file created with O_EXCL instead
+    fcntl = None
+
+
+class Manifest(object):
+    # Output file -> key of what it was made from, so unchanged outputs are
+    # not made again. A key hashes the inputs (the stats_digest of the
+    # bibles) and the version of the code writing the file; an output is
+    # current when its key is the same and the file is still the one that
+    # was recorded (same size and modification time).
+    #
+    # Worker processes each keep their own Manifest; save merges their
+    # changes into the file under a lock (flock, or where there is no fcntl
+    # a lock file that only one process can create). A Manifest without a
+    # file never finds anything current, which makes everything again.
+
+    manifest_file = "../cache/manifest.json"
+
+    # age after which a lock file left by a dead process is taken over
+    stale_lock_seconds = 60
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self.entries = self._read() if file_path else {}
+        self._changes = {}
+
+    @classmethod
+    def key(cls, *parts):
+        return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def name(cls, output):
+        return os.path.abspath(output)
+
+    def _read(self):
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as in_file:
+                return json.load(in_file)
+        except (OSError, ValueError):
+            return {}
+
+    def is_current(self, output, key):
+        entry = self.entries.get(Manifest.name(output))
+        if entry is None or entry['key'] != key:
+            return False
+        try:
+            stat = os.stat(output)
+        except OSError:
+            return False
+        return stat.st_size == entry['size'] and \
+               stat.st_mtime_ns == entry['mtime_ns']
+
+    def record(self, output, key):
+        stat = os.stat(output)
+        self.entries[Manifest.name(output)] = \
+                            self._changes[Manifest.name(output)] = {
+                                            'key': key,
+                                            'size': stat.st_size,
+                                            'mtime_ns': stat.st_mtime_ns}
+
+    def update(self, output, key, write):
+        # Calls write() to make output unless it is current; True if it did
+        if self.is_current(output, key):
+            return False
+        write()
+        self.record(output, key)
+        return True
+
+    def save(self):
+        if not self.file_path or not self._changes:
+            return
+        folder = os.path.dirname(self.file_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        lock = self._lock()
+        try:
+            entries = self._read()
+            entries.update(self._changes)
+            temp_path = "{0}.{1}.tmp".format(self.file_path, os.getpid())
+            with open(temp_path, "w", encoding="utf-8") as out_file:
+                json.dump(entries, out_file, indent=1, sort_keys=True)
+            os.replace(temp_path, self.file_path)
+        finally:
+            self._unlock(lock)
+        self.entries = entries
+        self._changes = {}
+
+    def _lock(self):
+        # What _unlock releases: the flock-ed file, or the path of the lock
+        # file this process created
+        if fcntl is not None:
+            lock_file = open(self.file_path + ".lock", "w")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return lock_file
+        lock_path = self.file_path + ".lock.excl"
+        while True:
+            try:
+                os.close(os.open(lock_path,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock_path
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > \
+                                                Manifest.stale_lock_seconds:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.01)
+
+    def _unlock(self, lock):
+        if fcntl is not None:
+            lock.close()
+        else:
+            os.remove(lock)
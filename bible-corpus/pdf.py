@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+
+import struct
+import zlib
+
+from lazy import LazyModule
+
+Image = LazyModule("PIL.Image")
+
+
+class ImagePDF(object):
+    # Multi-page PDF with one image per page, written while the pages are
+    # added, so only one image is held at a time. PNGs whose data PDF reads
+    # as is (8-bit gray or RGB, not interlaced) are copied without decoding:
+    # their zlib stream goes in with the PNG predictors, which is the case
+    # of the plots plotting.py writes. The others, like the RGBA PNGs of
+    # savefig, are decoded once (by PIL) and their pixels compressed; the
+    # alpha channel is only kept, as a soft mask, when some pixel is not
+    # opaque. Pages are the size of the image at its resolution, 72 dpi
+    # when the PNG has none.
+
+    _png_signature = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, "wb")
+        self._offsets = {}
+        self._pages = []
+        # 1 is the catalog and 2 the page tree, written by close
+        self._next = 3
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def _number(self):
+        number = self._next
+        self._next += 1
+        return number
+
+    def _write(self, number, dictionary, stream=None):
+        self._offsets[number] = self._file.tell()
+        if stream is not None:
+            dictionary += " /Length {0}".format(len(stream))
+        self._file.write("{0} 0 obj\n<<{1}>>\n".format(number,
+                                                       dictionary).encode())
+        if stream is not None:
+            self._file.write(b"stream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream\n")
+        self._file.write(b"endobj\n")
+
+    @classmethod
+    def read_png(cls, file_path):
+        # (header, dots per inch, compressed data) of a PNG: header is
+        # (width, height, bit depth, color type, interlace), dpi None when
+        # the file does not say
+        with open(file_path, "rb") as png_file:
+            data = png_file.read()
+        if not data.startswith(ImagePDF._png_signature):
+            raise ValueError("Not a PNG file: {0}".format(file_path))
+        header = None
+        dpi = None
+        chunks = []
+        position = len(ImagePDF._png_signature)
+        while position < len(data):
+            length, kind = struct.unpack_from(">I4s", data, position)
+            body = data[position + 8:position + 8 + length]
+            position += length + 12
+            if kind == b"IHDR":
+                width, height, depth, color, _, _, interlace = \
+                                            struct.unpack(">IIBBBBB", body)
+                header = (width, height, depth, color, interlace)
+            elif kind == b"pHYs":
+                x_density, _, unit = struct.unpack(">IIB", body)
+                if unit == 1:
+                    dpi = x_density * 0.0254
+            elif kind == b"IDAT":
+                chunks.append(body)
+            elif kind == b"IEND":
+                break
+        return header, dpi, b"".join(chunks)
+
+    def _image(self, width, height, colors, data, predictor=False,
+               mask=None):
+        dictionary = " /Type /XObject /Subtype /Image /Width {0}" \
+                     " /Height {1} /ColorSpace /{2} /BitsPerComponent 8" \
+                     " /Filter /FlateDecode".format(
+                                width, height,
+                                "DeviceRGB" if colors == 3 else "DeviceGray")
+        if predictor:
+            dictionary += " /DecodeParms << /Predictor 15 /Colors {0}" \
+                          " /BitsPerComponent 8 /Columns {1} >>".format(
+                                                                colors, width)
+        if mask is not None:
+            dictionary += " /SMask {0} 0 R".format(mask)
+        number = self._number()
+        self._write(number, dictionary, data)
+        return number
+
+    def add_png(self, file_path):
+        (width, height, depth, color, interlace), dpi, data = \
+                                                ImagePDF.read_png(file_path)
+        if depth == 8 and color in (0, 2) and not interlace:
+            image = self._image(width, height, 3 if color == 2 else 1, data,
+                                predictor=True)
+        else:
+            picture = Image.open(file_path)
+            if picture.mode not in ("L", "LA", "RGB", "RGBA"):
+                picture = picture.convert("RGBA")
+            mask = None
+            if picture.mode in ("LA", "RGBA"):
+                alpha = picture.getchannel("A")
+                if alpha.getextrema() != (255, 255):
+                    mask = self._image(width, height, 1,
+                                       zlib.compress(alpha.tobytes()))
+                picture = picture.convert(picture.mode[:-1])
+            image = self._image(width, height, len(picture.mode),
+                                zlib.compress(picture.tobytes()), mask=mask)
+        self._add_page(image, width, height, dpi or 72)
+
+    def _add_page(self, image, width, height, dpi):
+        size = ["{0:.2f}".format(pixels * 72 / dpi) for \
+                                                pixels in (width, height)]
+        contents = self._number()
+        self._write(contents, "", "q {0} 0 0 {1} 0 0 cm /Im0 Do Q".format(
+                                                        *size).encode())
+        page = self._number()
+        self._write(page, " /Type /Page /Parent 2 0 R"
+                          " /MediaBox [0 0 {0} {1}]"
+                          " /Resources << /XObject << /Im0 {2} 0 R >> >>"
+                          " /Contents {3} 0 R".format(size[0], size[1], image,
+                                                      contents))
+        self._pages.append(page)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._write(1, " /Type /Catalog /Pages 2 0 R")
+        self._write(2, " /Type /Pages /Kids [{0}] /Count {1}".format(
+                        " ".join("{0} 0 R".format(page) for \
+                                                    page in self._pages),
+                        len(self._pages)))
+        xref = self._file.tell()
+        self._file.write("xref\n0 {0}\n0000000000 65535 f \n".format(
+                                                        self._next).encode())
+        for number in range(1, self._next):
+            self._file.write("{0:010d} 00000 n \n".format(
+                                            self._offsets[number]).encode())
+        self._file.write("trailer\n<< /Size {0} /Root 1 0 R >>\n"
+                         "startxref\n{1}\n%%EOF\n".format(self._next,
+                                                          xref).encode())
+        self._file.close()
+
+
+def bundle(png_files, pdf_file):
+    # Writes the PNGs, in order, as the pages of pdf_file; returns the
+    # number of pages
+    with ImagePDF(pdf_file) as pdf:
+        for png_file in png_files:
+            pdf.add_png(png_file)
+        return len(pdf)
@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+
+import os
+import random
+
+from bible import Bible
+from generate import RandomBible
+from manifest import Manifest
+from plotting import plot_names, render_plots
+
+
+def process_language(file_path,
+                     plot_folder=None,
+                     random_folder=None,
+                     geomlen_folder=None,
+                     seed=None,
+                     corpus=None,
+                     plot_density=False,
+                     manifest=None):
+    # Whole per-language pipeline of the driver. It only depends on its
+    # arguments, so it can run in a worker process; the returned
+    # BibleSummary is what gets collected into a BibleGroup. manifest is
+    # the file of the Manifest of the plots, None to make all of them.
+    if seed is not None:
+        random.seed("{0}:{1}".format(seed, os.path.basename(file_path)))
+    
+    new_bible = Bible.from_source(file_path, corpus)
+    if len(new_bible) > 27:
+        new_bible = new_bible.get_new_testament()
+    print("({0}) Counted toks: {1}, Reported: {2}".format(
+                                            new_bible.language,
+                                            new_bible.token_count(),
+                                            new_bible.reported_word_count
+                                            )
+          )
+    
+    if plot_folder is not None:
+        timings = render_plots(new_bible, plot_folder, density=plot_density,
+                               manifest=Manifest(manifest))
+        skipped = len([plot_name for plot_name in plot_names \
+                                            if plot_name not in timings])
+        if skipped:
+            print("\t\t {0} plots up to date".format(skipped))
+        for plot_name, seconds in timings.items():
+            print("\t\t {0:<22}{1:>8.3f} s".format(plot_name, seconds))
+    
+    if random_folder is not None:
+        RandomBible.create_xml_from(new_bible, random_folder)
+    
+    if geomlen_folder is not None:
+        RandomBible.create_xml_from(new_bible, geomlen_folder, "geomlen")
+    
+    return new_bible.summary()
+
+
+def process_languages(file_paths, workers=1, **options):
+    # Summaries come back in the order of file_paths whatever the number
+    # of workers, so serial and parallel runs build the same BibleGroup
+    if workers <= 1:
+        return [process_language(file_path, **options) \
+                                                for file_path in file_paths]
+    
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_language, file_path, **options) \
+                                                for file_path in file_paths]
+        return [future.result() for future in futures]
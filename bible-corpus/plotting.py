@@ -0,0 +1,403 @@
+# -*- coding:utf-8 -*-
+
+# Headless rendering of the per-language plots. Run from this folder:
+#     python plotting.py plot_folder [file.xml ...] [--workers N]
+#                        [--density [--top K]] [--manifest file]
+
+from collections import OrderedDict
+import os
+import statistics
+import time
+
+import numpy as np
+
+from lazy import LazyModule
+from manifest import Manifest
+
+matplotlib_colors = LazyModule("matplotlib.colors")
+matplotlib_figure = LazyModule("matplotlib.figure")
+matplotlib_agg = LazyModule("matplotlib.backends.backend_agg")
+plt = LazyModule("matplotlib.pyplot")
+Image = LazyModule("PIL.Image")
+
+
+plot_names = ["freq_long",
+              "freq_varlong_novar",
+              "freq_varlong_var0",
+              "long_freq",
+              "long_varfreq_novar",
+              "long_varfreq_var0",
+              "freq_meanlong_var0",
+              "freq_meanlong_novar"]
+
+# bumped when the drawing of a plot changes, so Manifest makes it again
+plot_versions = dict((plot_name, 2) for plot_name in plot_names)
+
+# the plots that annotated, density and top change
+scatter_plots = ["freq_long", "long_freq"]
+
+
+def plot_file(plot_folder, plot_name, language):
+    return os.path.join(plot_folder, plot_name, language + ".png")
+
+
+def plot_key(bible, plot_name, annotated=False, density=False, top=0):
+    # Manifest key of a plot: its version, the statistics it is drawn from
+    # and the options it depends on
+    options = [annotated, density, top] if plot_name in scatter_plots \
+                                                                    else []
+    return Manifest.key(plot_name, plot_versions[plot_name],
+                        bible.stats_digest, options)
+
+
+class PlotData(object):
+    # Every dataset the plots of one language draw, computed once from its
+    # statistics (a Bible or a BibleSummary) instead of once per plot
+
+    def __init__(self, bible):
+        self.language = bible.language
+        tok_frequency = bible.tok_frequency
+        self.tokens = list(tok_frequency)
+        self.frequencies = np.fromiter(tok_frequency.values(), np.int64,
+                                       len(tok_frequency))
+        self.lengths = np.fromiter((len(token) for token in self.tokens),
+                                   np.int64, len(self.tokens))
+        self.max_length = max(bible.tok_freq_by_length)
+        self.max_frequency = max(bible.tokens_by_frequency)
+        self.max_variance_length = max(bible.variance_by_tok_length)
+
+        variance_by_tok_freq = bible.variance_by_tok_freq
+        mean_lengths = [(freq, statistics.mean([len(token) for \
+                                                        token in tokens])) \
+                        for freq, tokens in bible.tokens_by_frequency.items()]
+        self.mean_length_var0 = PlotData.bars(sorted(mean_lengths))
+        self.mean_length_novar = PlotData.bars(sorted(
+                                    (freq, mean) for freq, mean in mean_lengths \
+                                    if variance_by_tok_freq[freq] is not None))
+        self.length_variance_novar = PlotData.bars(
+                                    [(freq, variance) for freq, variance in \
+                                            variance_by_tok_freq.items() \
+                                            if variance is not None])
+        self.length_variance_var0 = PlotData.bars(
+                                    sorted(variance_by_tok_freq.items()))
+
+        variance_by_tok_length = bible.variance_by_tok_length
+        self.frequency_variance_novar = PlotData.bars(
+                                    [(length, variance) for length, variance \
+                                            in variance_by_tok_length.items() \
+                                            if variance is not None])
+        self.frequency_variance_var0 = PlotData.bars(
+                                    sorted(variance_by_tok_length.items()))
+
+    @classmethod
+    def bars(cls, dataset):
+        # (positions, heights) of a bar plot of (x, y) pairs; None heights,
+        # the variances of a single value, are drawn as 0
+        values = np.nan_to_num(np.array(dataset, dtype=np.float64
+                                        ).reshape(-1, 2))
+        return np.array(values[:, 0], dtype=np.int32), \
+               np.array(values[:, 1], dtype=np.float32)
+
+    def label_set(self):
+        # frequency -> length -> tokens, for the annotations
+        label_set = {}
+        for label, x, y in zip(self.tokens, self.frequencies.tolist(),
+                               self.lengths.tolist()):
+            label_set.setdefault(x, {}).setdefault(y, set([])).add(label)
+        return label_set
+
+    def density(self, frequency_bins):
+        # (frequency bin edges, length bin edges, number of token types in
+        # each frequency x length bin), one bin per length
+        counts, frequency_edges, length_edges = np.histogram2d(
+                            self.frequencies, self.lengths,
+                            [np.linspace(0, self.max_frequency,
+                                         frequency_bins + 1),
+                             np.arange(self.max_length + 2) - 0.5])
+        return frequency_edges, length_edges, counts
+
+    def top_tokens(self, count):
+        # Indexes of the count most frequent token types, most frequent first
+        count = min(count, len(self.tokens))
+        if not count:
+            return []
+        top = np.argpartition(-self.frequencies, count - 1)[:count]
+        return top[np.argsort(-self.frequencies[top], kind="stable")].tolist()
+
+    def frequency_ticks(self):
+        distance = min(self.max_frequency, 15)
+        return list(range(0, self.max_frequency,
+                          int(self.max_frequency / distance)))
+
+
+class PlotRenderer(object):
+    # Draws the plots on one Figure with the Agg canvas, cleared and reused
+    # from plot to plot, without pyplot and its global state. Each process
+    # keeps a single renderer (see shared).
+
+    figsize = (11.69, 8.27)
+
+    # frequency bins of the density mode of the scatter plots
+    frequency_bins = 200
+
+    _shared = None
+
+    def __init__(self, figsize=None):
+        self.figure = matplotlib_figure.Figure(figsize=figsize or \
+                                                        PlotRenderer.figsize)
+        matplotlib_agg.FigureCanvasAgg(self.figure)
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = PlotRenderer()
+        return cls._shared
+
+    def render(self, data, plot_folder="../plots/", plot_names=plot_names,
+               annotated=False, density=False, top=0):
+        # Saves plot_folder/<plot name>/<language>.png for each plot and
+        # returns plot name -> seconds
+        timings = OrderedDict()
+        for plot_name in plot_names:
+            start = time.perf_counter()
+            self.save(data, plot_name, plot_file(plot_folder, plot_name,
+                                                 data.language),
+                      annotated, density, top)
+            timings[plot_name] = time.perf_counter() - start
+        return timings
+
+    def save(self, data, plot_name, file_path, annotated=False,
+             density=False, top=0):
+        self.figure.clear()
+        draw(plot_name, self.figure.add_subplot(), data, annotated, density,
+             top)
+        self.write_png(file_path)
+        self.figure.clear()
+
+    def write_png(self, file_path):
+        # The figure as an RGB PNG: its background is opaque, so the alpha
+        # channel savefig writes holds nothing, and without it pdf.py copies
+        # the PNG data into the PDF instead of decoding it
+        canvas = self.figure.canvas
+        canvas.draw()
+        pixels = np.asarray(canvas.buffer_rgba())[:, :, :3]
+        dpi = self.figure.dpi
+        Image.fromarray(np.ascontiguousarray(pixels)).save(file_path,
+                                                           format="PNG",
+                                                           dpi=(dpi, dpi))
+
+
+def draw_scatter(axes, data, annotated, transposed, density=False, top=0):
+    # Frequency against length of every token type; transposed puts the
+    # lengths on the x axis. With density the types are counted in
+    # frequency x length bins (PlotRenderer.frequency_bins by length) and
+    # only the top most frequent ones are annotated, so the time to draw
+    # depends on the bins instead of on the size of the vocabulary.
+    length_ticks = range(data.max_length + 1)
+    if transposed:
+        axes.set_xticks(length_ticks)
+        axes.set_yticks(data.frequency_ticks())
+        points = data.lengths, data.frequencies
+    else:
+        axes.set_yticks(length_ticks)
+        axes.set_xticks(data.frequency_ticks())
+        points = data.frequencies, data.lengths
+
+    if density:
+        frequency_edges, length_edges, counts = \
+                            data.density(PlotRenderer.frequency_bins)
+        # the bins are uniform, so they are drawn as one image
+        extent = (frequency_edges[0], frequency_edges[-1],
+                  length_edges[0], length_edges[-1])
+        counts = np.ma.masked_equal(counts, 0)
+        if transposed:
+            extent = extent[2:] + extent[:2]
+        else:
+            counts = counts.T
+        image = axes.imshow(counts, origin="lower", aspect="auto",
+                            interpolation="nearest", extent=extent,
+                            norm=matplotlib_colors.LogNorm())
+        axes.figure.colorbar(image, ax=axes, label="Token types")
+        for index in data.top_tokens(top):
+            axes.annotate(data.tokens[index],
+                          xy=(points[0][index], points[1][index]))
+    else:
+        axes.scatter(np.array(points[0], dtype=np.int32),
+                     np.array(points[1], dtype=np.int32),
+                     marker='o')
+
+    if annotated and not density:
+        label_set = data.label_set()
+        for x, y in zip(points[0].tolist(), points[1].tolist()):
+            frequency, length = (y, x) if transposed else (x, y)
+            labels = label_set[frequency].pop(length, None)
+            if labels is not None:
+                axes.annotate(str(labels), xy=(x, y))
+
+    frequency_label, length_label = "Token Frequency", "Token Length"
+    if transposed:
+        axes.set_xlabel(length_label)
+        axes.set_ylabel(frequency_label)
+    else:
+        axes.set_ylabel(length_label)
+        axes.set_xlabel(frequency_label)
+
+
+def draw_bars(axes, bars, xlabel, ylabel, xticks=None):
+    if xticks is not None:
+        axes.set_xticks(xticks)
+    axes.bar(*bars)
+    axes.set_xlabel(xlabel)
+    axes.set_ylabel(ylabel)
+
+
+def draw(plot_name, axes, data, annotated=False, density=False, top=0):
+    # density and top only change the scatter plots, see draw_scatter
+    if plot_name == "freq_long":
+        draw_scatter(axes, data, annotated, False, density, top)
+    elif plot_name == "long_freq":
+        draw_scatter(axes, data, annotated, True, density, top)
+    elif plot_name == "freq_meanlong_novar":
+        draw_bars(axes, data.mean_length_novar,
+                  "Token Frequency", "Mean of Token Lengths")
+    elif plot_name == "freq_meanlong_var0":
+        draw_bars(axes, data.mean_length_var0,
+                  "Token Frequency", "Mean of Token Lengths")
+    elif plot_name == "freq_varlong_novar":
+        draw_bars(axes, data.length_variance_novar,
+                  "Token Frequency", "Variance of Token Lengths by Frequency")
+    elif plot_name == "freq_varlong_var0":
+        draw_bars(axes, data.length_variance_var0,
+                  "Token Frequency", "Variance of Token Lengths by Frequency")
+    elif plot_name == "long_varfreq_novar":
+        draw_bars(axes, data.frequency_variance_novar,
+                  "Token Length", "Variance of Token Frequency by Length",
+                  range(data.max_variance_length + 1))
+    elif plot_name == "long_varfreq_var0":
+        draw_bars(axes, data.frequency_variance_var0,
+                  "Token Length", "Variance of Token Frequency by Length",
+                  range(data.max_variance_length + 1))
+    else:
+        raise ValueError("Unknown plot: {0}".format(plot_name))
+    axes.set_title(data.language)
+    axes.set_xlim(left=0)
+    axes.set_ylim(bottom=0)
+
+
+def render_plots(bible, plot_folder="../plots/", plot_names=plot_names,
+                 annotated=False, density=False, top=0, manifest=None):
+    # Renders the plots of a Bible or BibleSummary with the renderer of the
+    # process; returns plot name -> seconds, "data" being the time spent
+    # computing the datasets. With a Manifest the plots that are current
+    # are skipped (and left out of the timings) and the others recorded.
+    if manifest is not None:
+        keys = dict((plot_name, plot_key(bible, plot_name, annotated, density,
+                                         top)) for plot_name in plot_names)
+        plot_names = [plot_name for plot_name in plot_names if \
+                        not manifest.is_current(plot_file(plot_folder,
+                                                          plot_name,
+                                                          bible.language),
+                                                keys[plot_name])]
+    if not plot_names:
+        return OrderedDict()
+
+    start = time.perf_counter()
+    data = PlotData(bible)
+    timings = OrderedDict([("data", time.perf_counter() - start)])
+    timings.update(PlotRenderer.shared().render(data, plot_folder,
+                                                plot_names, annotated,
+                                                density, top))
+    if manifest is not None:
+        for plot_name in plot_names:
+            manifest.record(plot_file(plot_folder, plot_name, bible.language),
+                            keys[plot_name])
+        manifest.save()
+    return timings
+
+
+def show_plot(bible, plot_name, annotated=False, density=False, top=0):
+    # Interactive display of one plot through pyplot
+    figure = plt.figure()
+    draw(plot_name, figure.add_subplot(), PlotData(bible), annotated,
+         density, top)
+    plt.show()
+    plt.close(figure)
+
+
+def render_language(file_path, plot_folder="../plots/", plot_names=plot_names,
+                    corpus=None, density=False, top=0, manifest_file=None):
+    from bible import Bible
+
+    bible = Bible.from_source(file_path, corpus)
+    if len(bible) > 27:
+        bible = bible.get_new_testament()
+    return render_plots(bible, plot_folder, plot_names, False, density, top,
+                        Manifest(manifest_file) if manifest_file else None)
+
+
+def render_languages(file_paths, plot_folder="../plots/", workers=1,
+                     plot_names=plot_names, corpus=None, density=False,
+                     top=0, manifest_file=None):
+    # file path -> timings of render_language, spreading the languages over
+    # a pool of worker processes when workers > 1
+    for plot_name in plot_names:
+        folder = os.path.join(plot_folder, plot_name)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+    if workers <= 1:
+        return OrderedDict((file_path, render_language(file_path, plot_folder,
+                                                       plot_names, corpus,
+                                                       density, top,
+                                                       manifest_file)) \
+                                                for file_path in file_paths)
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_language, file_path, plot_folder,
+                                   plot_names, corpus, density, top,
+                                   manifest_file) \
+                                                for file_path in file_paths]
+        return OrderedDict((file_path, future.result()) for \
+                                    file_path, future in zip(file_paths,
+                                                             futures))
+
+
+def total_timings(timings):
+    # plot name -> seconds over all the languages
+    totals = OrderedDict()
+    for language_timings in timings.values():
+        for plot_name, seconds in language_timings.items():
+            totals[plot_name] = totals.get(plot_name, 0) + seconds
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Per-language plots")
+    parser.add_argument("plot_folder")
+    parser.add_argument("file_paths", nargs="*")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--corpus", default=None,
+                        help="shared corpus file built by corpus.py")
+    parser.add_argument("--density", action="store_true",
+                        help="draw the scatter plots as binned densities")
+    parser.add_argument("--top", type=int, default=0,
+                        help="annotate the most frequent tokens of the "
+                             "density plots")
+    parser.add_argument("--manifest", default=None,
+                        help="skip the plots this manifest has as current, "
+                             "e.g. " + Manifest.manifest_file)
+    args = parser.parse_args()
+
+    file_paths = args.file_paths or \
+                            sorted(glob.glob("../bibles/Usable/*.xml"))
+    start = time.perf_counter()
+    timings = render_languages(file_paths, args.plot_folder, args.workers,
+                               corpus=args.corpus, density=args.density,
+                               top=args.top, manifest_file=args.manifest)
+    elapsed = time.perf_counter() - start
+    for plot_name, seconds in total_timings(timings).items():
+        print("\t{0:<24}{1:>10.3f} s".format(plot_name, seconds))
+    print("{0} languages in {1:.1f} s".format(len(timings), elapsed))
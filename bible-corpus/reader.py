@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+class BibleReader(object):
+    # Incremental reader for the CES bible files. Books and verses are
+    # emitted while the file is being parsed and the elements behind them
+    # are cleared, so only one book is held in memory at any time unless
+    # keep_tree is requested.
+
+    levels = ("book", "chapter", "verse")
+
+    def __init__(self, file_path, keep_tree=False):
+        self.file_path = file_path
+        self.keep_tree = keep_tree
+        self.metadata = {}
+        self.xml_root = None
+
+    @property
+    def xml_tree(self):
+        if self.xml_root is None:
+            return None
+        return ET.ElementTree(self.xml_root)
+
+    @classmethod
+    def parse_header(cls, xml_header):
+        metadata = {}
+        content_info = xml_header.find("fileDesc"
+                                       ).find("extent")
+
+        for child in content_info:
+            if child.tag == "wordCount":
+                metadata['reported_word_count'] = int(child.text)
+            else:
+                metadata['byte_count'] = int(child.text)
+
+        language_info = xml_header.find("profileDesc"
+                                        ).find("langUsage"
+                                               ).find("language")
+
+        metadata['language'] = language_info.text.strip()
+        metadata['iso639'] = language_info.attrib["iso639"].strip()
+        metadata['lang_id'] = language_info.attrib["id"].strip()
+
+        script_info = xml_header.find("profileDesc"
+                                        ).find("wsdUsage"
+                                               ).find("writingSystem")
+        metadata['encoding'] = script_info.attrib['id']
+        return metadata
+
+    @classmethod
+    def verse_text(cls, xml_node):
+        try:
+            return xml_node.text.strip()
+        except:
+            return ""
+
+    def _release(self, elem, parents):
+        if self.keep_tree:
+            return
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+    def _parse(self, unit):
+        # containers above the requested unit are released as they close,
+        # the ones below it are released together with the unit
+        containers = BibleReader.levels[:BibleReader.levels.index(unit)]
+        parents = []
+        for event, elem in ET.iterparse(self.file_path,
+                                        events=("start", "end")):
+            if event == "start":
+                if self.xml_root is None:
+                    self.xml_root = elem
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            node_type = elem.attrib.get("type", "")
+            if elem.tag == "cesHeader":
+                self.metadata.update(BibleReader.parse_header(elem))
+            elif node_type == unit:
+                yield elem, parents
+                self._release(elem, parents)
+            elif node_type in containers:
+                self._release(elem, parents)
+
+    def books(self):
+        for book, _ in self._parse("book"):
+            yield book
+
+    def verses(self):
+        # (book id, chapter id, verse id, text) in document order
+        for verse, parents in self._parse("verse"):
+            chapter = parents[-1]
+            book = parents[-2]
+            yield (book.attrib['id'],
+                   chapter.attrib['id'],
+                   verse.attrib['id'],
+                   BibleReader.verse_text(verse))
+
+    def book_records(self):
+        # Plain (book id, [(chapter id, [(verse id, text)])]) tuples, the
+        # form in which parsed books are cached
+        for book in self.books():
+            chapters = []
+            for chapter in book:
+                if chapter.attrib.get("type", "") == "chapter":
+                    verses = [(verse.attrib['id'],
+                               BibleReader.verse_text(verse))
+                              for verse in chapter
+                              if verse.attrib.get("type", "") == "verse"]
+                    chapters.append((chapter.attrib['id'], verses))
+            yield (book.attrib['id'], chapters)
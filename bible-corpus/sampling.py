@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+
+import random
+
+import numpy as np
+
+
+class MultisetSampler(object):
+    # Draws without replacement from a multiset of symbols: every draw takes
+    # its symbol out of the remaining counts, so once all of them are drawn
+    # exactly the initial counts have been handed out. draw(size) makes the
+    # draws of a whole sequence at once: a multivariate hypergeometric split
+    # of size over the remaining counts gives how many of each symbol the
+    # sequence gets and a permutation orders them, which has the same
+    # distribution as size draws one after the other.
+
+    def __init__(self, counts, seed=None):
+        # counts: symbol -> count. Without a seed the generator is seeded
+        # from the random module, so random.seed makes the draws repeatable.
+        self.symbols = list(counts)
+        self.remaining = np.array([counts[symbol] for symbol in self.symbols],
+                                  dtype=np.int64)
+        self.total = int(self.remaining.sum())
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.generator = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.total
+
+    def counts(self):
+        return dict(zip(self.symbols, self.remaining.tolist()))
+
+    def draw(self, size):
+        # Indexes into symbols of size draws, in draw order
+        if size > self.total:
+            raise ValueError("Only {0} symbols left to draw {1}".format(
+                                                            self.total, size))
+        split = self.generator.multivariate_hypergeometric(self.remaining,
+                                                           size)
+        self.remaining -= split
+        self.total -= size
+        return self.generator.permutation(np.repeat(
+                                        np.arange(len(self.symbols)), split))
+
+
+class WordStream(object):
+    # Words made of symbols drawn independently, each with the probability
+    # of its count in counts, the separator included: the runs between
+    # separators are the words (so their lengths follow a geometric
+    # distribution) and empty runs are skipped. The symbols are drawn in
+    # blocks of block_size at once and the words cut from each block with
+    # str.split; a word cut by the end of a block goes on in the next one.
+
+    def __init__(self, counts, separator=" ", block_size=1 << 16, seed=None):
+        self.symbols = [symbol for symbol, count in counts.items() if count]
+        weights = np.array([counts[symbol] for symbol in self.symbols],
+                           dtype=np.float64)
+        self.cumulative = np.cumsum(weights / weights.sum())
+        self.codes = np.array([ord(symbol) for symbol in self.symbols],
+                              dtype=np.uint32)
+        self.separator = separator
+        self.block_size = block_size
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.generator = np.random.default_rng(seed)
+        self._words = []
+        self._next = 0
+        self._partial = ""
+
+    def _block(self):
+        indexes = np.searchsorted(self.cumulative,
+                                  self.generator.random(self.block_size),
+                                  side="right")
+        # the last sum can round below 1
+        np.minimum(indexes, len(self.codes) - 1, out=indexes)
+        parts = (self._partial + self.codes[indexes].tobytes().decode(
+                                            "utf-32-le")).split(self.separator)
+        self._partial = parts.pop()
+        return [word for word in parts if word]
+
+    def take(self, count):
+        # The next count words
+        words = self._words[self._next:self._next + count]
+        self._next += len(words)
+        while len(words) < count:
+            self._words = self._block()
+            self._next = min(count - len(words), len(self._words))
+            words.extend(self._words[:self._next])
+        return words
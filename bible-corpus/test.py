@@ -6,11 +6,6 @@ import sys
 from bible import Bible
 from generate import RandomBible
 
-try:
-    import xml.etree.cElementTree as ET
-except ImportError:
-    import xml.etree.ElementTree as ET
-
 orig = "../bibles/Usable/Chinantec-NT.xml"
 rand1 = "../bibles/Random_SAME_FLEN/Chinantec random(keeps long_char frequency).xml"
 rand2 = "../bibles/Random_GEOM_LEN/Chinantec random(geometric length).xml"
@@ -20,17 +15,8 @@ rand1_bible = Bible.from_path(rand1)
 rand2_bible = Bible.from_path(rand2)
 
 def count_chars(bible):
-    unique_chars = bible.unique_chars
-    original_path = bible.file_path
-    xml_tree = ET.ElementTree(file=original_path)
-            
-    xml_root = xml_tree.getroot()
-    xml_header, xml_text = xml_root.getchildren()
-    
-    char_bag = RandomBible.count_character(unique_chars,
-                                           xml_text)
-    
-    return char_bag
+    # from the loaded bible, without parsing its file again
+    return RandomBible.count_character(bible.unique_chars(), bible)
 
 orig_bible_chars = count_chars(orig_bible)
 rand1_bible_chars = count_chars(rand1_bible)
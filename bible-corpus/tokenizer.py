@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+
+import re
+import unicodedata
+
+
+class Tokenizer(object):
+    # Tokenizers turn verse texts into lists of lower-case tokens.
+    # tokenize_batch handles a whole sequence of verses (typically a book)
+    # in one call and must return the same as tokenizing them one by one.
+
+    def tokenize(self, text):
+        raise NotImplementedError
+
+    def tokenize_batch(self, texts):
+        return [self.tokenize(text) for text in texts]
+
+    def __call__(self, text):
+        return self.tokenize(text)
+
+
+class PunctuationTokenizer(Tokenizer):
+    # Drops every character that is neither a word character nor
+    # whitespace, removes tabs and newlines and splits on spaces
+
+    punctuation = re.compile(r'[^\w\s]', re.UNICODE)
+
+    def tokenize(self, text):
+        temp_text = self.punctuation.sub('',
+                                         text.replace("\t", 
+                                                      "").replace("\n", 
+                                                                  "")
+                                         ).lower()
+        return list(filter(None, temp_text.split(" ")))
+
+    def tokenize_batch(self, texts):
+        # One substitution over the whole batch; newlines are removed from
+        # each text first so they can separate the verses
+        texts = list(texts)
+        if not texts:
+            return []
+        temp_text = self.punctuation.sub('',
+                                         "\n".join([text.replace("\t", 
+                                                                 "").replace(
+                                                                 "\n", 
+                                                                 "") \
+                                                    for text in texts])
+                                         ).lower()
+        return [list(filter(None, line.split(" "))) \
+                                        for line in temp_text.split("\n")]
+
+
+class _PunctuationTable(dict):
+    # str.translate table deleting punctuation and symbols, filled in per
+    # code point on first use
+
+    def __missing__(self, codepoint):
+        if unicodedata.category(chr(codepoint))[0] in "PS":
+            value = None
+        else:
+            value = codepoint
+        self[codepoint] = value
+        return value
+
+
+class PretokenisedTokenizer(Tokenizer):
+    # For the files whose script does not separate words by spaces
+    # (Chinese, Japanese, Thai, Vietnamese syllables) and that come already
+    # tokenised with spaces. Tokens are split on any whitespace and only
+    # punctuation and symbols are removed, keeping the combining marks
+    # that the \w class would strip (Thai vowels and tone marks).
+
+    table = _PunctuationTable()
+
+    def tokenize(self, text):
+        return text.translate(self.table).lower().split()
+
+    def tokenize_batch(self, texts):
+        # NUL cannot appear in XML text and is not whitespace, so it can
+        # separate the verses of the batch
+        texts = list(texts)
+        if not texts:
+            return []
+        temp_text = "\0".join(texts).translate(self.table).lower()
+        return [line.split() for line in temp_text.split("\0")]
+
+
+tokenizers = {}
+
+# iso639 codes of the pre-tokenised files. The language ids of the headers
+# are the corpus own two letter codes, not ISO 639-1 ("th" is Tuareg), so
+# they are not looked at.
+pretokenised_languages = set(["zho", "cmn", "chi",
+                              "jpn",
+                              "tha",
+                              "vie"])
+
+
+def register_tokenizer(name, tokenizer):
+    tokenizers[name] = tokenizer
+    return tokenizer
+
+
+def get_tokenizer(name="default"):
+    try:
+        return tokenizers[name]
+    except KeyError:
+        raise KeyError("Unknown tokenizer: {0}".format(name))
+
+
+def tokenizer_for(metadata):
+    # Name of the tokenizer that suits a file, from its header metadata
+    if metadata.get("iso639", "") in pretokenised_languages:
+        return "pretokenised"
+    return "default"
+
+
+def tokenize(text, name="default"):
+    return get_tokenizer(name).tokenize(text)
+
+
+register_tokenizer("default", PunctuationTokenizer())
+register_tokenizer("pretokenised", PretokenisedTokenizer())
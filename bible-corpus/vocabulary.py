@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+
+from array import array
+
+import numpy as np
+
+
+class Vocabulary(object):
+    # Interns the token types of a corpus. Every type is stored once and
+    # gets a small integer id, assigned in order of first appearance, so
+    # texts can be kept and counted as arrays of ids.
+
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+        self.lengths = array('I')
+        self._length_array = None
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.ids
+
+    def __getitem__(self, token_id):
+        return self.tokens[token_id]
+
+    def intern(self, token):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.ids[token] = token_id
+            self.tokens.append(token)
+            self.lengths.append(len(token))
+        return token_id
+
+    def encode(self, tokens):
+        ids = self.ids
+        intern = self.intern
+        return array('I', [ids[token] if token in ids else intern(token) \
+                                                        for token in tokens])
+
+    def decode(self, token_ids):
+        tokens = self.tokens
+        return [tokens[token_id] for token_id in token_ids]
+
+    def length_array(self):
+        # numpy copy of the type lengths, refreshed when types were added
+        if self._length_array is None or \
+           len(self._length_array) != len(self.lengths):
+            self._length_array = np.array(self.lengths, dtype=np.int64)
+        return self._length_array
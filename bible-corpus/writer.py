@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+
+from xml.sax.saxutils import escape
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+
+class BibleWriter(object):
+    # Incremental copy of a CES bible file, the counterpart of BibleReader.
+    # The header and the books are handed, once parsed, to the functions
+    # given to write, which change them in place, and are written and
+    # released, so only one book is held in memory at any time. The
+    # elements around them (cesDoc, text, body) are written tag by tag as
+    # the parser reaches them. The output is what ElementTree.write(
+    # encoding="unicode") writes for the parsed tree: no XML declaration,
+    # comments dropped, empty elements as <tag />.
+    #
+    # The text of an element is only known for sure at the start of its
+    # first child and its tail at the next start or end, so the start tags
+    # and the tails wait for the next event.
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    @classmethod
+    def is_unit(cls, elem):
+        return elem.tag == "cesHeader" or \
+               elem.attrib.get("type", "") == "book"
+
+    @classmethod
+    def start_tag(cls, elem):
+        # "<tag attributes", escaped as ElementTree does
+        return ET.tostring(ET.Element(elem.tag, elem.attrib),
+                           encoding="unicode")[:-len(" />")]
+
+    def write(self, results_path, header=None, book=None):
+        with open(results_path, "w", encoding="utf-8") as out_file:
+            parents = []
+            unit = None
+            # element whose start tag is not written yet
+            opened = None
+            # element whose tail is not written yet
+            closed = None
+            for event, elem in ET.iterparse(self.file_path,
+                                            events=("start", "end")):
+                if unit is not None and elem is not unit:
+                    continue
+
+                if opened is not None and event == "start":
+                    out_file.write(BibleWriter.start_tag(opened) + ">")
+                    if opened.text:
+                        out_file.write(escape(opened.text))
+                    opened = None
+                if closed is not None:
+                    if closed.tail:
+                        out_file.write(escape(closed.tail))
+                    closed = None
+
+                if event == "start":
+                    if BibleWriter.is_unit(elem):
+                        unit = elem
+                    else:
+                        opened = elem
+                        parents.append(elem)
+                    continue
+
+                # the parser may have read past the end of elem already, its
+                # tail is then set; else it is set later on the cleared elem
+                tail = elem.tail
+                elem.tail = None
+                if elem is unit:
+                    transform = header if elem.tag == "cesHeader" else book
+                    if transform is not None:
+                        transform(elem)
+                    out_file.write(ET.tostring(elem, encoding="unicode"))
+                    unit = None
+                elif elem is opened:
+                    parents.pop()
+                    if elem.text:
+                        out_file.write(BibleWriter.start_tag(elem) + ">" +
+                                       escape(elem.text) +
+                                       "</" + elem.tag + ">")
+                    else:
+                        out_file.write(BibleWriter.start_tag(elem) + " />")
+                    opened = None
+                else:
+                    parents.pop()
+                    out_file.write("</" + elem.tag + ">")
+                elem.clear()
+                elem.tail = tail
+                if parents:
+                    parents[-1].remove(elem)
+                closed = elem
+            if closed is not None and closed.tail:
+                out_file.write(escape(closed.tail))
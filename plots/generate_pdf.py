@@ -1,20 +1,54 @@
 # -*- coding:utf-8 -*-
 
+# One PDF per corpus and plot type (plots_<plot>_<corpus>.pdf) with the
+# PNGs of every language, assembled in process by bible-corpus/pdf.py, the
+# plot types in parallel. Run from this folder:
+#     python generate_pdf.py [output folder]
+
+from concurrent.futures import ProcessPoolExecutor
+import glob
 import os
-import subprocess
-
-for directory in os.listdir("."):
-    if os.path.isdir(directory):
-        for dirname in os.listdir("./" + directory):
-            if os.path.isdir("./" + directory + "/" +  dirname):
-                arg0 ="./{0}/{1}/*.png".format(directory,
-                                               dirname)
-                if directory == "Random_GEOM_LEN":
-                    corpus = "nlfp"
-                elif directory == "Random_SAME_FLEN":
-                    corpus = "lfp"
-                else:
-                    corpus = "bibles"
-                arg1 = "plots_{0}_{1}.pdf".format(dirname, corpus)
-                subprocess.call(["convert", 
-                                 arg0, arg1])
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "bible-corpus"))
+from pdf import bundle
+
+
+def bundles(out_folder="."):
+    # (PNG files, PDF file) of every plot folder
+    for directory in sorted(os.listdir(".")):
+        if os.path.isdir(directory):
+            for dirname in sorted(os.listdir("./" + directory)):
+                if os.path.isdir("./" + directory + "/" +  dirname):
+                    png_files = sorted(glob.glob("./{0}/{1}/*.png".format(
+                                                                directory,
+                                                                dirname)))
+                    if not png_files:
+                        continue
+                    if directory == "Random_GEOM_LEN":
+                        corpus = "nlfp"
+                    elif directory == "Random_SAME_FLEN":
+                        corpus = "lfp"
+                    else:
+                        corpus = "bibles"
+                    pdf_file = os.path.join(out_folder,
+                                            "plots_{0}_{1}.pdf".format(dirname,
+                                                                       corpus))
+                    yield png_files, pdf_file
+
+
+def bundle_job(job):
+    png_files, pdf_file = job
+    return bundle(png_files, pdf_file)
+
+
+if __name__ == "__main__":
+    out_folder = sys.argv[1] if len(sys.argv) > 1 else "."
+    if not os.path.isdir(out_folder):
+        os.makedirs(out_folder)
+    jobs = list(bundles(out_folder))
+    with ProcessPoolExecutor() as executor:
+        pages = executor.map(bundle_job, jobs)
+        for (_, pdf_file), count in zip(jobs, pages):
+            print("{0}: {1} pages".format(pdf_file, count))